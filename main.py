@@ -1,16 +1,32 @@
-from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Header, Query, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional, Union
 import sqlite3
 import json
 import time
+import base64
+import gzip
+import hashlib
+import struct
+from datetime import datetime, timezone
 import logging
 import threading
+import weakref
 import heapq
 import redis
+import redis.asyncio as aioredis
 import asyncio
+import os
+import uuid
+import queue
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 
 # Logging
 logging.basicConfig(
@@ -24,47 +40,682 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # App and DB setup
-app = FastAPI(title="Wall Robot Control System", version="2.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    event_outbox.close()
+    await event_hub.close()
+    shutdown_planner_pool()
+    db_writer.close()
+    db_pool.close_all()
+
+app = FastAPI(title="Wall Robot Control System", version="2.0.0", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
-DB_NAME = "robot_trajectories.db"
+DB_NAME = os.getenv("ROBOT_DB_PATH", "robot_trajectories.db")
 db_lock = threading.Lock()
 
-# Redis setup
+# Events for this process's websockets, fanned out through a bounded queue
+# per client. A client whose queue fills up can't keep up and is
+# disconnected instead of holding messages for everyone else.
+WS_QUEUE_SIZE = 256
+
+class EventHub:
+    def __init__(self, queue_size=WS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._clients = set()
+        self._task = None
+        self._loop = None
+        self.evictions = 0
+
+    def subscribe(self):
+        # Must be called on the event loop. A None message means the client
+        # was evicted.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new loop (tests, server reload): the old listener is gone
+            self._clients.clear()
+            self._task = None
+            self._loop = loop
+        client_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._clients.add(client_queue)
+        if event_bus.listen is not None and (self._task is None or self._task.done()):
+            self._task = loop.create_task(event_bus.listen(self))
+        return client_queue
+
+    def unsubscribe(self, client_queue):
+        self._clients.discard(client_queue)
+        if not self._clients and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def broadcast(self, message):
+        for client_queue in list(self._clients):
+            try:
+                client_queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._clients.discard(client_queue)
+                self.evictions += 1
+                while not client_queue.empty():
+                    client_queue.get_nowait()
+                client_queue.put_nowait(None)
+
+    def broadcast_threadsafe(self, message):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.broadcast, message)
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.broadcast(None)
+        self._clients.clear()
+
+event_hub = EventHub()
+
+# Event bus: how published events reach the websockets. The in-process bus
+# is enough for a single node; with several nodes, Redis pub/sub carries
+# events between them. EVENT_BUS=auto uses Redis if it answers at startup.
+EVENT_BUS = os.getenv("EVENT_BUS", "auto")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 REDIS_CHANNEL = "robot_updates"
-redis_client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+REDIS_RETRY_SECONDS = 5
 
-def publish_event(message: str):
+class InProcessEventBus:
+    name = "memory"
+    listen = None
+
+    def deliver(self, messages):
+        for message in messages:
+            event_hub.broadcast_threadsafe(message)
+
+    def close(self):
+        pass
+
+class RedisEventBus:
+    name = "redis"
+
+    def __init__(self, url=REDIS_URL):
+        self.url = url
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def deliver(self, messages):
+        # One round trip for the whole batch
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipe.publish(REDIS_CHANNEL, message)
+        pipe.execute()
+
+    async def listen(self, hub):
+        while True:
+            client = aioredis.Redis.from_url(self.url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(REDIS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        hub.broadcast(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis subscriber error: {str(e)}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception as e:
+                    logger.warning(f"Redis subscriber close failed: {str(e)}")
+            await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+    def close(self):
+        self.client.close()
+
+def create_event_bus(kind=EVENT_BUS):
+    if kind == "memory":
+        return InProcessEventBus()
+    bus = RedisEventBus()
+    if kind == "redis":
+        return bus
     try:
-        redis_client.publish(REDIS_CHANNEL, message)
-        logger.info(f"Published event: {message.encode('ascii', 'ignore').decode()}")
+        redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5).ping()
+        return bus
     except Exception as e:
-        logger.error(f"Redis publish failed: {str(e)}")
+        logger.warning(f"Redis unavailable ({str(e)}), using the in-process event bus")
+        bus.close()
+        return InProcessEventBus()
+
+# Outbox: publish_event only enqueues, and a drain thread hands batches to
+# the bus and writes the log lines, so request latency never includes a
+# Redis round trip or a log write. When the buffer is full, new events are
+# dropped and counted rather than blocking the caller.
+EVENT_OUTBOX_SIZE = int(os.getenv("EVENT_OUTBOX_SIZE", 1024))
+EVENT_BATCH_SIZE = 100
+
+class EventOutbox:
+    def __init__(self, bus, size=EVENT_OUTBOX_SIZE, batch_size=EVENT_BATCH_SIZE):
+        self.bus = bus
+        self.batch_size = batch_size
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="event-outbox", daemon=True)
+        self._thread.start()
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            self.bus.close()
+
+    def stats(self):
+        return {
+            "bus": self.bus.name,
+            "queued": self._queue.qsize(),
+            "published": self.published,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            batch = [message] if message is not None else []
+            while message is not None and len(batch) < self.batch_size:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is not None:
+                    batch.append(message)
+            if batch:
+                self._deliver(batch)
+            if message is None:
+                return
+
+    def _deliver(self, batch):
+        try:
+            self.bus.deliver(batch)
+            self.published += len(batch)
+            for message in batch:
+                logger.info(f"Published event: {message.encode('ascii', 'ignore').decode()}")
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Event publish failed for {len(batch)} events: {str(e)}")
+
+event_bus = create_event_bus()
+event_outbox = EventOutbox(event_bus)
+logger.info(f"Event bus: {event_bus.name}")
+
+def publish_event(message: str):
+    event_outbox.put(message)
+
+# Long-lived SQLite connections: one writer, used under db_lock, and one
+# reader per thread. In WAL mode readers see the last committed state and
+# never wait for the writer, so they don't take db_lock. A reader is closed
+# when its thread exits, so threadpool workers that come and go don't pile
+# up open connections.
+class ReaderHandle:
+    # Lives in the thread-local; collected when the thread exits
+    def __init__(self, generation, conn):
+        self.generation = generation
+        self.conn = conn
+
+class ConnectionPool:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._connections = []
+        self._generation = 0
+
+    def _connect(self, read_only):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -16000")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA foreign_keys = ON")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def writer(self):
+        if self._writer is None:
+            self._writer = self._connect(read_only=False)
+        return self._writer
+
+    def reader(self):
+        handle = getattr(self._local, "reader", None)
+        if handle is None or handle.generation != self._generation:
+            conn = self._connect(read_only=True)
+            handle = ReaderHandle(self._generation, conn)
+            weakref.finalize(handle, self._release, conn)
+            self._local.reader = handle
+        return handle.conn
+
+    def _release(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def close_all(self):
+        # db_lock: wait for a write batch in progress rather than closing
+        # the connection under it
+        with db_lock, self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._writer = None
+            self._generation += 1
+
+db_pool = ConnectionPool(DB_NAME)
+
+# Group commit: request handlers queue write operations and a single
+# writer thread applies them in batches, one transaction (and one fsync)
+# per batch. Each operation runs in its own savepoint so a failing one
+# doesn't take the rest of its batch down with it.
+DB_WRITE_BATCH_SIZE = 64
+DB_WRITE_BATCH_DELAY = 0.002
+
+class DBWriter:
+    def __init__(self, pool, batch_size=DB_WRITE_BATCH_SIZE, batch_delay=DB_WRITE_BATCH_DELAY):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, operation):
+        # operation(conn) runs on the writer thread; the returned future
+        # resolves with its result once the batch has committed.
+        future = Future()
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((future, operation))
+        return future
+
+    def close(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_delay
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        results = []
+        with db_lock:
+            conn = self.pool.writer()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for future, operation in batch:
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        results.append((future, operation(conn), None))
+                        conn.execute("RELEASE op")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                        results.append((future, None, e))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Write batch failed: {str(e)}")
+                results = [(future, None, e) for future, _ in batch]
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+db_writer = DBWriter(db_pool)
+
+# Path storage formats (trajectory_paths.path_format)
+GRID_RESOLUTION = 0.05
+PATH_FORMAT_JSON = 0    # legacy JSON text
+PATH_FORMAT_F32 = 1     # little-endian float32 (x, y) pairs
+PATH_FORMAT_GRID16 = 2  # little-endian int16 (col, row) cells on the GRID_RESOLUTION lattice
+PATH_FORMAT_RLE = 3     # start cell + run-length encoded lattice moves, see encode_rle
+
+# RLE move codes. Consecutive planner points differ by one cell (or repeat
+# at row joins), so a path is mostly long runs of the same move. Anything
+# else is stored as an explicit jump.
+RLE_MOVES = [(1, 0), (-1, 0), (0, 1), (0, -1), (0, 0)]
+RLE_LETTERS = "RLDUS"
+RLE_JUMP = 5
+
+def _write_varint(out, value):
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return (value >> 1) ^ -(value & 1), pos
+
+def encode_rle(cells):
+    # cells: (n, 2) integer (col, row) array. Layout is a stream of zigzag
+    # varints: start col, start row, then count << 3 | code per run, with
+    # dx, dy following every jump.
+    out = bytearray()
+    if len(cells) == 0:
+        return bytes(out)
+    _write_varint(out, int(cells[0, 0]))
+    _write_varint(out, int(cells[0, 1]))
+    deltas = np.diff(cells, axis=0)
+    codes = np.full(len(deltas), RLE_JUMP, dtype=np.int8)
+    for code, (dx, dy) in enumerate(RLE_MOVES):
+        codes[(deltas[:, 0] == dx) & (deltas[:, 1] == dy)] = code
+    if len(codes) == 0:
+        return bytes(out)
+    starts = np.flatnonzero(np.concatenate(([True], (codes[1:] != codes[:-1]) | (codes[1:] == RLE_JUMP))))
+    counts = np.diff(np.append(starts, len(codes)))
+    for start, count in zip(starts.tolist(), counts.tolist()):
+        code = int(codes[start])
+        _write_varint(out, count << 3 | code)
+        if code == RLE_JUMP:
+            _write_varint(out, int(deltas[start, 0]))
+            _write_varint(out, int(deltas[start, 1]))
+    return bytes(out)
+
+def parse_rle(data):
+    # Returns the start cell and a list of (code, count, dx, dy) runs
+    if not data:
+        return None, []
+    x, pos = _read_varint(data, 0)
+    y, pos = _read_varint(data, pos)
+    runs = []
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        code, count = value & 7, value >> 3
+        if code == RLE_JUMP:
+            dx, pos = _read_varint(data, pos)
+            dy, pos = _read_varint(data, pos)
+        else:
+            dx, dy = RLE_MOVES[code]
+        runs.append((code, count, dx, dy))
+    return (x, y), runs
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON")
-    return conn
+def decode_rle(data):
+    start, runs = parse_rle(data)
+    if start is None:
+        return np.zeros((0, 2), dtype=np.int64)
+    steps = np.repeat(
+        np.array([[dx, dy] for _, _, dx, dy in runs], dtype=np.int64).reshape(-1, 2),
+        [count for _, count, _, _ in runs],
+        axis=0
+    )
+    return np.vstack(([start], steps)).cumsum(axis=0)
+
+def decode_rle_window(data, start, count):
+    # Cells start .. start + count - 1 of an RLE path. Runs before the
+    # window are skipped arithmetically, so this is O(runs + count).
+    origin, runs = parse_rle(data)
+    if origin is None:
+        return np.zeros((0, 2), dtype=np.int64)
+    x, y = origin
+    skip, need = start, count - 1
+    taken = []
+    for _, run, dx, dy in runs:
+        if skip:
+            step = min(run, skip)
+            x, y, skip, run = x + step * dx, y + step * dy, skip - step, run - step
+        if not skip and run and need:
+            step = min(run, need)
+            taken.append((dx, dy, step))
+            need -= step
+        if not skip and not need:
+            break
+    if skip:
+        return np.zeros((0, 2), dtype=np.int64)
+    steps = np.repeat(
+        np.array([[dx, dy] for dx, dy, _ in taken], dtype=np.int64).reshape(-1, 2),
+        [step for _, _, step in taken],
+        axis=0
+    )
+    return np.vstack(([(x, y)], steps)).cumsum(axis=0)
+
+def rle_to_text(data):
+    # Human-readable form used in API responses, e.g. "R99D1L99"; jumps
+    # read as "J<dx>,<dy>".
+    start, runs = parse_rle(data)
+    moves = "".join(
+        f"J{dx},{dy}" if code == RLE_JUMP else f"{RLE_LETTERS[code]}{count}"
+        for code, count, dx, dy in runs
+    )
+    return {"start": list(start or []), "resolution": GRID_RESOLUTION, "moves": moves}
+
+def encode_path(path_data):
+    points = np.asarray(path_data, dtype=np.float64).reshape(-1, 2)
+    cells = np.rint(points / GRID_RESOLUTION)
+    # Points within float noise of the lattice (older planners accumulated
+    # coordinates) are stored as exact cells.
+    if np.allclose(cells * GRID_RESOLUTION, points, rtol=0, atol=1e-9):
+        return PATH_FORMAT_RLE, encode_rle(cells.astype(np.int64))
+    return PATH_FORMAT_F32, points.astype("<f4").tobytes()
+
+def decode_path(path_format, data):
+    # Returns an (n, 2) float64 array of (x, y) points
+    if path_format == PATH_FORMAT_RLE:
+        return decode_rle(data) * GRID_RESOLUTION
+    if path_format == PATH_FORMAT_GRID16:
+        return np.frombuffer(data, dtype="<i2").reshape(-1, 2) * GRID_RESOLUTION
+    if path_format == PATH_FORMAT_F32:
+        return np.frombuffer(data, dtype="<f4").reshape(-1, 2).astype(np.float64)
+    return np.asarray(json.loads(data), dtype=np.float64).reshape(-1, 2)
+
+# Bytes per point for the fixed-width formats, which can be sliced in place
+PATH_POINT_WIDTH = {PATH_FORMAT_F32: 8, PATH_FORMAT_GRID16: 4}
+
+def read_path_window(conn, trajectory_id, path_format, start, count):
+    # Returns points start .. start + count - 1 as an (n, 2) float64 array.
+    # Fixed-width paths are read through incremental blob I/O (substr before
+    # Python 3.11), so only the window's bytes leave the database.
+    width = PATH_POINT_WIDTH.get(path_format)
+    if width and hasattr(conn, "blobopen"):
+        with conn.blobopen("trajectory_paths", "path_data", trajectory_id, readonly=True) as blob:
+            blob.seek(min(start * width, len(blob)))
+            data = blob.read(count * width)
+        return decode_path(path_format, data)
+    if width:
+        (data,) = conn.execute("SELECT substr(path_data, ?, ?) FROM trajectory_paths WHERE trajectory_id = ?",
+                               (start * width + 1, count * width, trajectory_id)).fetchone()
+        return decode_path(path_format, data)
+    (data,) = conn.execute("SELECT path_data FROM trajectory_paths WHERE trajectory_id = ?", (trajectory_id,)).fetchone()
+    if path_format == PATH_FORMAT_RLE:
+        return decode_rle_window(data, start, count) * GRID_RESOLUTION
+    return decode_path(path_format, data)[start:start + count]
+
+def path_to_json(path_format, data):
+    # JSON text of the path as [[x, y], ...], the same text json.dumps gives
+    # for the decoded points. Lattice coordinates repeat a lot, so each
+    # distinct one is formatted once instead of once per point.
+    if path_format == PATH_FORMAT_RLE:
+        cells = decode_rle(data)
+    elif path_format == PATH_FORMAT_GRID16:
+        cells = np.frombuffer(data, dtype="<i2").reshape(-1, 2).astype(np.int64)
+    else:
+        return json.dumps(decode_path(path_format, data).tolist(), separators=(",", ":"))
+    if len(cells) == 0:
+        return "[]"
+    low = int(cells.min())
+    table = np.array([repr(k * GRID_RESOLUTION) for k in range(low, int(cells.max()) + 1)], dtype=object)
+    return "[[" + "],[".join(map(",".join, table[cells - low].tolist())) + "]]"
+
+# Summary of a path kept on the trajectories row, so listings and metadata
+# lookups never have to read trajectory_paths.
+TRAJECTORY_METADATA_COLUMNS = [
+    ("point_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("path_length", "REAL NOT NULL DEFAULT 0"),
+    ("min_x", "REAL"),
+    ("min_y", "REAL"),
+    ("max_x", "REAL"),
+    ("max_y", "REAL"),
+    ("content_hash", "TEXT"),
+]
+
+def path_metadata(points):
+    # Returns values for TRAJECTORY_METADATA_COLUMNS. The hash is over the
+    # decoded points, so it doesn't change if the storage format does.
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    content_hash = hashlib.sha256(points.astype("<f8").tobytes()).hexdigest()
+    if len(points) == 0:
+        return 0, 0.0, None, None, None, None, content_hash
+    steps = np.diff(points, axis=0)
+    (min_x, min_y), (max_x, max_y) = points.min(axis=0), points.max(axis=0)
+    return (
+        len(points),
+        float(np.hypot(steps[:, 0], steps[:, 1]).sum()),
+        float(min_x), float(min_y), float(max_x), float(max_y),
+        content_hash
+    )
+
+def migrate_trajectory_storage(cursor):
+    # Older databases kept the path (JSON text, later a packed blob) in the
+    # trajectories row itself. Move it to trajectory_paths and fill in the
+    # metadata columns on the way.
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(trajectories)")}
+    for column, declaration in TRAJECTORY_METADATA_COLUMNS:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE trajectories ADD COLUMN {column} {declaration}")
+    if "path_data" not in columns:
+        return 0
+    path_format_column = "path_format" if "path_format" in columns else str(PATH_FORMAT_JSON)
+    legacy_ids = [row[0] for row in cursor.execute("SELECT id FROM trajectories").fetchall()]
+    for trajectory_id in legacy_ids:
+        old_format, data = cursor.execute(
+            f"SELECT {path_format_column}, path_data FROM trajectories WHERE id = ?", (trajectory_id,)).fetchone()
+        points = decode_path(old_format, data)
+        path_format, blob = encode_path(points)
+        cursor.execute("INSERT OR REPLACE INTO trajectory_paths (trajectory_id, path_format, path_data) VALUES (?, ?, ?)",
+                       (trajectory_id, path_format, blob))
+        assignments = ", ".join(f"{column} = ?" for column, _ in TRAJECTORY_METADATA_COLUMNS)
+        cursor.execute(f"UPDATE trajectories SET {assignments} WHERE id = ?", (*path_metadata(points), trajectory_id))
+    cursor.execute("ALTER TABLE trajectories DROP COLUMN path_data")
+    if "path_format" in columns:
+        cursor.execute("ALTER TABLE trajectories DROP COLUMN path_format")
+    return len(legacy_ids)
 
 def init_db():
     with db_lock:
-        conn = get_db_connection()
+        conn = db_pool.writer()
         cursor = conn.cursor()
-        cursor.execute('''
+        metadata_columns = ",\n                ".join(f"{column} {declaration}" for column, declaration in TRAJECTORY_METADATA_COLUMNS)
+        cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS trajectories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 wall_width REAL NOT NULL,
                 wall_height REAL NOT NULL,
                 obstacles TEXT,
-                path_data TEXT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                execution_time REAL
+                execution_time REAL,
+                {metadata_columns}
+            )
+        ''')
+        # Path payloads live in their own table so trajectories rows stay
+        # small and a page of them fits in the cache.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trajectory_paths (
+                trajectory_id INTEGER PRIMARY KEY REFERENCES trajectories(id) ON DELETE CASCADE,
+                path_format INTEGER NOT NULL,
+                path_data BLOB NOT NULL
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS planner_cache (
+                key TEXT PRIMARY KEY,
+                path_format INTEGER NOT NULL,
+                path_data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_planner_cache_created_at ON planner_cache(created_at)')
+        # Running byte total of planner_cache, kept by PlannerCache.put so
+        # the budget check never has to scan the table (it is counted once,
+        # on the first put after the table is created)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS planner_cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                bytes INTEGER NOT NULL
+            )
+        ''')
+        # Compressed response bodies, see get_trajectory
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trajectory_bodies (
+                trajectory_id INTEGER NOT NULL REFERENCES trajectories(id) ON DELETE CASCADE,
+                variant TEXT NOT NULL,
+                coding TEXT NOT NULL,
+                body BLOB NOT NULL,
+                PRIMARY KEY (trajectory_id, variant, coding)
+            ) WITHOUT ROWID
+        ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_name ON trajectories(name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON trajectories(created_at)')
+        # Covering indexes for the paginated listing: newest first, and by
+        # name prefix. Both carry every listed column so pages are served
+        # from the index alone.
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_created_at_id_listing
+            ON trajectories(created_at DESC, id DESC, name, wall_width, wall_height, execution_time)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_name_listing
+            ON trajectories(name, created_at, id, wall_width, wall_height, execution_time)
+        ''')
+        migrated = migrate_trajectory_storage(cursor)
         conn.commit()
-        conn.close()
+        if migrated:
+            logger.info(f"Moved {migrated} trajectory paths to trajectory_paths")
+            conn.execute("VACUUM")
 
 init_db()
 
@@ -83,89 +734,829 @@ class WallConfig(BaseModel):
 class TrajectoryRequest(BaseModel):
     name: str
     wall_config: WallConfig
+    planner: Literal["astar", "boustrophedon"] = "astar"
+    search: Literal["astar", "jps"] = "astar"
 
-class TrajectoryResponse(BaseModel):
+class TrajectoryMetadata(BaseModel):
     id: int
     name: str
     wall_width: float
     wall_height: float
     obstacles: List[Obstacle]
-    path_data: List[List[float]]
     created_at: str
     execution_time: float
+    point_count: int
+    path_length: float
+    bounds: Optional[List[float]] = None  # [min_x, min_y, max_x, max_y]
+    content_hash: Optional[str] = None
+
+class TrajectoryResponse(TrajectoryMetadata):
+    path_data: List[List[float]]
+
+class PathRLE(BaseModel):
+    start: List[int]
+    resolution: float
+    moves: str
+
+class TrajectoryRLEResponse(TrajectoryMetadata):
+    path_rle: PathRLE
 
 # Enhanced Coverage Planner with A* Detour
 class CoveragePlannerSmart:
-    def __init__(self, wall_width, wall_height, obstacles):
+    def __init__(self, wall_width, wall_height, obstacles, mode="astar", search="astar"):
         self.wall_width = wall_width
         self.wall_height = wall_height
         self.obstacles = obstacles
-        self.grid_resolution = 0.05
-        self.rows = int(wall_height / self.grid_resolution)
-        self.cols = int(wall_width / self.grid_resolution)
-        self.grid = [[0 for _ in range(self.cols)] for _ in range(self.rows)]
+        self.mode = mode
+        self.search = search
+        self.expanded_nodes = 0
+        self._jump_tables = None
+        self._buffers = None
+        self._generation = 0
+        self._labels = None
+        self._progress = None
+        self.grid_resolution = GRID_RESOLUTION
+        self.rows = max(int(wall_height / self.grid_resolution), 0)
+        self.cols = max(int(wall_width / self.grid_resolution), 0)
+        # Occupancy grid: 0 = free, 1 = obstacle. The memoryview gives the
+        # search loops cheap scalar reads without boxing numpy integers.
+        self.grid = np.zeros((self.rows, self.cols), dtype=np.uint8)
         self._mark_obstacles()
+        self._cells = memoryview(self.grid)
+        # Blocked-cell prefix sums along rows and columns, so any straight
+        # run can be checked for obstacles in O(1).
+        self._row_prefix = np.zeros((self.rows, self.cols + 1), dtype=np.int32)
+        np.cumsum(self.grid, axis=1, out=self._row_prefix[:, 1:])
+        self._col_prefix = np.zeros((self.rows + 1, self.cols), dtype=np.int32)
+        np.cumsum(self.grid, axis=0, out=self._col_prefix[1:, :])
 
     def _mark_obstacles(self):
         for obs in self.obstacles:
-            x_start = int(obs.x / self.grid_resolution)
-            x_end = int((obs.x + obs.width) / self.grid_resolution)
-            y_start = int(obs.y / self.grid_resolution)
-            y_end = int((obs.y + obs.height) / self.grid_resolution)
-            for y in range(y_start, min(y_end + 1, self.rows)):
-                for x in range(x_start, min(x_end + 1, self.cols)):
-                    self.grid[y][x] = 1
+            x_start = max(int(obs.x / self.grid_resolution), 0)
+            x_end = min(int((obs.x + obs.width) / self.grid_resolution) + 1, self.cols)
+            y_start = max(int(obs.y / self.grid_resolution), 0)
+            y_end = min(int((obs.y + obs.height) / self.grid_resolution) + 1, self.rows)
+            if x_start < x_end and y_start < y_end:
+                self.grid[y_start:y_end, x_start:x_end] = 1
 
     def _heuristic(self, a, b):
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
-    def _neighbors(self, node):
-        dirs = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-        result = []
-        for dy, dx in dirs:
-            ny, nx = node[0] + dy, node[1] + dx
-            if 0 <= ny < self.rows and 0 <= nx < self.cols and self.grid[ny][nx] == 0:
-                result.append((ny, nx))
-        return result
+    def _search_buffers(self):
+        # Flat per-cell search state shared by every a_star call of this
+        # planner. A slot is only valid when its stamp equals the current
+        # generation, so starting a new search never clears anything.
+        if self._buffers is None:
+            size = self.rows * self.cols
+            self._buffers = {
+                "seen": [0] * size,
+                "closed": [0] * size,
+                "g": [0] * size,
+                "parent": [0] * size,
+                "blocked": memoryview(self.grid.reshape(-1)),
+            }
+        self._generation += 1
+        return self._buffers
 
     def a_star(self, start, goal):
+        buffers = self._search_buffers()
+        gen = self._generation
+        seen, closed, g_score, parent, blocked = (
+            buffers["seen"], buffers["closed"], buffers["g"], buffers["parent"], buffers["blocked"])
+        rows, cols = self.rows, self.cols
+        size = rows * cols
+        gy, gx = goal
+        source = start[0] * cols + start[1]
+        target = gy * cols + gx
+        seen[source] = gen
+        g_score[source] = 0
+        parent[source] = -1
+        # Heap entries are f * size + index: one int per entry, ordered by
+        # f and then by row-major position like the (f, (y, x)) tuples were.
+        open_set = [self._heuristic(start, goal) * size + source]
+        heappop, heappush = heapq.heappop, heapq.heappush
+
+        while open_set:
+            current = heappop(open_set) % size
+            if closed[current] == gen:
+                continue
+            closed[current] = gen
+            self.expanded_nodes += 1
+            if current == target:
+                path = []
+                while current != -1:
+                    path.append(divmod(current, cols))
+                    current = parent[current]
+                path.reverse()
+                return path
+            cy, cx = divmod(current, cols)
+            tentative = g_score[current] + 1
+            for neighbor, ny, nx, inside in (
+                (current + cols, cy + 1, cx, cy + 1 < rows),
+                (current - cols, cy - 1, cx, cy > 0),
+                (current + 1, cy, cx + 1, cx + 1 < cols),
+                (current - 1, cy, cx - 1, cx > 0),
+            ):
+                if not inside or blocked[neighbor]:
+                    continue
+                if seen[neighbor] != gen or tentative < g_score[neighbor]:
+                    seen[neighbor] = gen
+                    g_score[neighbor] = tentative
+                    parent[neighbor] = current
+                    heappush(open_set, (tentative + abs(ny - gy) + abs(nx - gx)) * size + neighbor)
+        return []
+
+    def _free(self, y, x):
+        return 0 <= y < self.rows and 0 <= x < self.cols and self._cells[y, x] == 0
+
+    def _build_jump_tables(self):
+        # For every cell, the next blocked cell and the next "forced" cell
+        # (where a vertical turn becomes necessary) in each row direction,
+        # so a horizontal jump is a couple of table lookups.
+        rows, cols = self.rows, self.cols
+        free = np.zeros((rows + 2, cols + 2), dtype=bool)
+        free[1:-1, 1:-1] = self.grid == 0
+        inner = np.s_[1:-1, 1:-1]
+        up, down = free[:-2, 1:-1], free[2:, 1:-1]
+        up_left, up_right = free[:-2, :-2], free[:-2, 2:]
+        down_left, down_right = free[2:, :-2], free[2:, 2:]
+        forced_right = (up & ~up_left) | (down & ~down_left)
+        forced_left = (up & ~up_right) | (down & ~down_right)
+        blocked = ~free[inner]
+
+        index = np.broadcast_to(np.arange(cols, dtype=np.int32), (rows, cols))
+        def next_true(mask):
+            marked = np.where(mask, index, cols).astype(np.int32)
+            return np.ascontiguousarray(np.minimum.accumulate(marked[:, ::-1], axis=1)[:, ::-1])
+        def prev_true(mask):
+            marked = np.where(mask, index, -1).astype(np.int32)
+            return np.maximum.accumulate(marked, axis=1)
+
+        self._jump_tables = {
+            1: (memoryview(next_true(blocked)), memoryview(next_true(forced_right))),
+            -1: (memoryview(prev_true(blocked)), memoryview(prev_true(forced_left))),
+        }
+
+    def _jump_horizontal(self, y, x, dx, goal):
+        x += dx
+        if not 0 <= x < self.cols:
+            return None
+        blocked, forced = self._jump_tables[dx]
+        stop, hit = blocked[y, x], forced[y, x]
+        if stop == x:
+            return None
+        candidates = []
+        if (hit - stop) * dx < 0:
+            candidates.append(hit)
+        if goal[0] == y and (goal[1] - x) * dx >= 0 and (goal[1] - stop) * dx < 0:
+            candidates.append(goal[1])
+        if not candidates:
+            return None
+        return (y, min(candidates) if dx == 1 else max(candidates))
+
+    def _jump(self, y, x, dy, dx, goal):
+        # Canonical paths take vertical moves as early as possible, so a
+        # horizontal run only stops where a vertical turn is forced and a
+        # vertical run stops wherever a horizontal scan finds something.
+        if dx:
+            return self._jump_horizontal(y, x, dx, goal)
+        free = self._free
+        while True:
+            y += dy
+            if not free(y, x):
+                return None
+            if (y, x) == goal:
+                return (y, x)
+            if self._jump_horizontal(y, x, 1, goal) or self._jump_horizontal(y, x, -1, goal):
+                return (y, x)
+
+    def _jump_directions(self, node, parent):
+        if parent is None:
+            return [(1, 0), (-1, 0), (0, 1), (0, -1)]
+        dy = (node[0] > parent[0]) - (node[0] < parent[0])
+        dx = (node[1] > parent[1]) - (node[1] < parent[1])
+        if dy:
+            return [(dy, 0), (0, 1), (0, -1)]
+        dirs = [(0, dx)]
+        for vy in (-1, 1):
+            if self._free(node[0] + vy, node[1]) and not self._free(node[0] + vy, node[1] - dx):
+                dirs.append((vy, 0))
+        return dirs
+
+    def jps(self, start, goal):
+        if self._jump_tables is None:
+            self._build_jump_tables()
         open_set = []
-        heapq.heappush(open_set, (0, start))
+        heapq.heappush(open_set, (self._heuristic(start, goal), start))
         came_from = {}
         g_score = {start: 0}
-        f_score = {start: self._heuristic(start, goal)}
+        closed = set()
 
         while open_set:
             _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue
+            closed.add(current)
+            self.expanded_nodes += 1
             if current == goal:
-                path = []
+                jump_points = [current]
                 while current in came_from:
-                    path.append(current)
                     current = came_from[current]
-                path.append(start)
-                path.reverse()
+                    jump_points.append(current)
+                jump_points.reverse()
+                path = [start]
+                for a, b in zip(jump_points, jump_points[1:]):
+                    path.extend(self._line(a, b)[1:])
                 return path
-            for neighbor in self._neighbors(current):
-                tentative = g_score[current] + 1
-                if neighbor not in g_score or tentative < g_score[neighbor]:
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative
-                    f_score[neighbor] = tentative + self._heuristic(neighbor, goal)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
+            for dy, dx in self._jump_directions(current, came_from.get(current)):
+                successor = self._jump(current[0], current[1], dy, dx, goal)
+                if successor is None:
+                    continue
+                tentative = g_score[current] + self._heuristic(current, successor)
+                if successor not in g_score or tentative < g_score[successor]:
+                    came_from[successor] = current
+                    g_score[successor] = tentative
+                    heapq.heappush(open_set, (tentative + self._heuristic(successor, goal), successor))
         return []
 
-    def generate_path(self):
-        path = []
+    def _run_blocked(self, a, b):
+        (y0, x0), (y1, x1) = a, b
+        if y0 == y1:
+            lo, hi = sorted((x0, x1))
+            return int(self._row_prefix[y0, hi + 1] - self._row_prefix[y0, lo])
+        lo, hi = sorted((y0, y1))
+        return int(self._col_prefix[hi + 1, x0] - self._col_prefix[lo, x0])
+
+    def _line(self, a, b):
+        if a[0] == b[0]:
+            return [(a[0], x) for x in self._span(a[1], b[1])]
+        return [(y, a[1]) for y in self._span(a[0], b[0])]
+
+    def _straight_path(self, start, goal):
+        # An L-shaped route is already a shortest path on this grid, so when
+        # every cell after the start is free there is nothing to search for.
+        cells = self._cells
+        for corner in ((goal[0], start[1]), (start[0], goal[1])):
+            blocked = (self._run_blocked(start, corner) + self._run_blocked(corner, goal)
+                       - cells[corner] - cells[start])
+            if blocked == 0:
+                return self._line(start, corner) + self._line(corner, goal)[1:]
+        return None
+
+    def _route(self, start, goal):
+        search = self.jps if self.search == "jps" else self.a_star
+        return self._straight_path(start, goal) or search(start, goal)
+
+    def _free_segments(self):
+        # Free runs of every row as inclusive (x_start, x_end) pairs, found
+        # with one diff over the grid padded with blocked border columns.
+        padded = np.ones((self.rows, self.cols + 2), dtype=np.int8)
+        padded[:, 1:-1] = self.grid
+        edges = np.diff(padded, axis=1)
+        starts_y, starts_x = np.nonzero(edges == -1)
+        ends_x = np.nonzero(edges == 1)[1] - 1
+        segments = [[] for _ in range(self.rows)]
+        for y, a, b in zip(starts_y.tolist(), starts_x.tolist(), ends_x.tolist()):
+            segments[y].append((a, b))
+        return segments
+
+    @staticmethod
+    def _overlaps(row, prev):
+        # (i, j) for every run in row that touches run j of the previous row
+        i = j = 0
+        while i < len(row) and j < len(prev):
+            a, b = row[i]
+            pa, pb = prev[j]
+            if a <= pb and pa <= b:
+                yield i, j
+            if b < pb:
+                i += 1
+            else:
+                j += 1
+
+    def _component_labels(self):
+        # Union-find over the free runs of each row: runs that touch in
+        # adjacent rows share a 4-connected component. Every free cell then
+        # takes its run's root via one cumulative sum over the run starts;
+        # blocked cells are labelled -1.
+        if self._labels is not None:
+            return self._labels
+        parent = []
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        prev, prev_ids = [], []
+        for row in self._free_segments():
+            ids = list(range(len(parent), len(parent) + len(row)))
+            parent.extend(ids)
+            for i, j in self._overlaps(row, prev):
+                ri, rj = find(ids[i]), find(prev_ids[j])
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+            prev, prev_ids = row, ids
+
+        free = self.grid == 0
+        roots = np.array([find(i) for i in range(len(parent))] or [0], dtype=np.int32)
+        padded = np.ones((self.rows, self.cols + 1), dtype=np.int8)
+        padded[:, 1:] = self.grid
+        starts = np.diff(padded, axis=1) == -1
+        run_index = np.cumsum(starts.ravel()).reshape(self.rows, self.cols) - 1
+        self._labels = np.where(free, roots[np.maximum(run_index, 0)], -1)
+        return self._labels
+
+    def _nearest_free(self, cell):
+        # Closest free cell to cell by Manhattan distance (first in row
+        # order on ties), or None when the whole wall is blocked
+        free_y, free_x = np.nonzero(self._component_labels() >= 0)
+        if free_y.size == 0:
+            return None
+        i = int((np.abs(free_y - cell[0]) + np.abs(free_x - cell[1])).argmin())
+        return (int(free_y[i]), int(free_x[i]))
+
+    def _reachable_target(self, y, x, component):
+        # Snap (y, x) to the closest cell of the row inside component, or
+        # None when the row has no reachable cell at all. -1 marks blocked
+        # cells, never a component.
+        if component < 0:
+            return None
+        labels = self._component_labels()
+        if labels[y, x] == component:
+            return (y, x)
+        candidates = np.flatnonzero(labels[y] == component)
+        if candidates.size == 0:
+            return None
+        return (y, int(candidates[np.abs(candidates - x).argmin()]))
+
+    def _boustrophedon_cells(self):
+        # A cell grows downwards while its segment overlaps exactly one
+        # segment in the next row and vice versa; splits and merges around
+        # obstacles open new cells.
+        cells = []
+        prev, prev_cells = [], []
+        for y, row in enumerate(self._free_segments()):
+            above = [[] for _ in row]
+            below = [0] * len(prev)
+            for i, j in self._overlaps(row, prev):
+                above[i].append(j)
+                below[j] += 1
+            row_cells = []
+            for (a, b), links in zip(row, above):
+                if len(links) == 1 and below[links[0]] == 1:
+                    idx = prev_cells[links[0]]
+                    cells[idx].append((y, a, b))
+                else:
+                    idx = len(cells)
+                    cells.append([(y, a, b)])
+                row_cells.append(idx)
+            prev, prev_cells = row, row_cells
+        return cells
+
+    @staticmethod
+    def _span(start, stop):
+        step = 1 if stop >= start else -1
+        return range(start, stop + step, step)
+
+    def _cover_cell(self, rows, entry_x):
+        y, a, b = rows[0]
+        far = b if entry_x == a else a
+        yield [(y, x) for x in self._span(entry_x, far)]
+        x = far
+        for (y0, a0, b0), (y1, a1, b1) in zip(rows, rows[1:]):
+            # Step into the next row through a column both segments share,
+            # then sweep it end to end in the opposite direction.
+            near = b1 if x == b0 else a1
+            far = a1 if near == b1 else b1
+            col = near if a0 <= near <= b0 else x
+            segment = [(y0, c) for c in self._span(x, col)][1:]
+            segment += [(y1, c) for c in self._span(col, near)]
+            segment += [(y1, c) for c in self._span(near, far)][1:]
+            yield segment
+            x = far
+
+    def _report(self, done, total):
+        if self._progress is not None:
+            self._progress(done, total)
+
+    def _boustrophedon_sweep(self):
+        cells = self._boustrophedon_cells()
+        labels = self._component_labels()
+        total_rows = sum(len(cell) for cell in cells)
+        done_rows = 0
+        remaining = set(range(len(cells)))
+        current = None
+        while remaining:
+            oy, ox = current or (0, 0)
+            idx = min(remaining, key=lambda i: (
+                abs(cells[i][0][0] - oy) + min(abs(cells[i][0][1] - ox), abs(cells[i][0][2] - ox)), i))
+            remaining.discard(idx)
+            y, a, b = cells[idx][0]
+            entry = (y, a) if abs(a - ox) <= abs(b - ox) else (y, b)
+            if current is None:
+                # Cells outside the first cell's component can never be
+                # reached, so drop them instead of searching towards them.
+                remaining = {i for i in remaining if labels[cells[i][0][0], cells[i][0][1]] == labels[entry]}
+            else:
+                yield self._route(current, entry)
+            for segment in self._cover_cell(cells[idx], entry[1]):
+                yield segment
+                current = segment[-1]
+                done_rows += 1
+                self._report(done_rows, total_rows)
+        self._report(total_rows, total_rows)
+
+    def _row_sweep(self):
+        if self.cols == 0 or self.rows == 0:
+            return
+        # Start at the free cell closest to the origin, as the boustrophedon
+        # sweep does, so an obstacle in the corner doesn't strand the robot
+        current = self._nearest_free((0, 0))
+        if current is None:
+            return
+        component = int(self._component_labels()[current])
         direction = 1
-        current = (0, 0)
         for y in range(self.rows):
-            target = (y, self.cols - 1) if direction == 1 else (y, 0)
-            sub_path = self.a_star(current, target)
-            for cell in sub_path:
-                path.append([cell[1] * self.grid_resolution, cell[0] * self.grid_resolution])
-            current = target
+            target = self._reachable_target(y, self.cols - 1 if direction == 1 else 0, component)
+            if target is not None:
+                yield self._route(current, target)
+                current = target
             direction *= -1
+            self._report(y + 1, self.rows)
+
+    def generate_path(self, progress=None):
+        # Yields the path as lists of [x, y] points, one per row sweep or
+        # transition, as soon as each is planned. progress, if given, is
+        # called as progress(rows_done, rows_total).
+        self._progress = progress
+        sweep = self._boustrophedon_sweep() if self.mode == "boustrophedon" else self._row_sweep()
+        for sub_path in sweep:
+            if sub_path:
+                yield [[cell[1] * self.grid_resolution, cell[0] * self.grid_resolution] for cell in sub_path]
+
+    def full_path(self, progress=None):
+        return [point for segment in self.generate_path(progress) for point in segment]
+
+# Planning is CPU-bound pure Python, so it runs in worker processes to keep
+# the event loop (and the GIL) free for other requests and websockets.
+PLANNER_WORKERS = max(int(os.getenv("PLANNER_WORKERS", os.cpu_count() or 1)), 1)
+planner_pool = None
+planner_pool_lock = threading.Lock()
+
+# Background planning jobs. Workers report row progress over a
+# multiprocessing queue that a drain thread folds into the jobs table.
+# Streaming requests get their planned segments over the same queue, handed
+# to the listener registered in streams.
+JOB_RETENTION_SECONDS = 3600
+jobs = {}
+jobs_lock = threading.Lock()
+streams = {}
+streams_lock = threading.Lock()
+job_progress_queue = None
+job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="planner-jobs")
+worker_progress_queue = None
+
+def init_planner_worker(progress_queue):
+    global worker_progress_queue
+    worker_progress_queue = progress_queue
+
+def drain_job_progress(progress_queue):
+    # Messages are (job_id, kind, value): kind "progress" carries a
+    # percentage, "segment" a list of points and "end" closes a stream.
+    while True:
+        try:
+            job_id, kind, value = progress_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError, ValueError):
+            # ValueError: the queue was closed when its pool was shut down
+            # or replaced
+            return
+        if kind != "progress":
+            with streams_lock:
+                listener = streams.get(job_id)
+            if listener:
+                listener(value)
+            continue
+        with jobs_lock:
+            job = jobs.get(job_id)
+            if job and job["status"] in ("queued", "running"):
+                job["status"] = "running"
+                job["progress"] = value
+
+def get_planner_pool():
+    global planner_pool, job_progress_queue
+    with planner_pool_lock:
+        if planner_pool is None:
+            job_progress_queue = multiprocessing.Queue()
+            planner_pool = ProcessPoolExecutor(
+                max_workers=PLANNER_WORKERS,
+                initializer=init_planner_worker,
+                initargs=(job_progress_queue,)
+            )
+            threading.Thread(target=drain_job_progress, args=(job_progress_queue,), daemon=True).start()
+            logger.info(f"Started planner pool with {PLANNER_WORKERS} workers")
+        return planner_pool
+
+def replace_broken_pool(broken):
+    # A worker that dies (OOM, kill -9) breaks the whole pool for good.
+    # Drop it with its progress queue so the next submit starts a fresh one;
+    # the old drain thread exits once the queue is closed.
+    global planner_pool, job_progress_queue
+    with planner_pool_lock:
+        if planner_pool is not broken:
+            return
+        logger.warning("Planner pool is broken, starting a new one")
+        planner_pool = None
+        job_progress_queue.close()
+        job_progress_queue = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def submit_plan(*args):
+    # Submits plan_path to the pool, replacing the pool once if it broke
+    pool = get_planner_pool()
+    try:
+        return pool.submit(plan_path, *args)
+    except BrokenProcessPool:
+        replace_broken_pool(pool)
+        return get_planner_pool().submit(plan_path, *args)
+
+def plan_path(wall_width, wall_height, obstacles, mode="astar", search="astar", job_id=None, stream=False):
+    planner = CoveragePlannerSmart(wall_width, wall_height, obstacles, mode, search)
+    if job_id is None or worker_progress_queue is None:
+        return planner.full_path()
+    if stream:
+        # Each segment goes out as soon as it is planned; "end" follows the
+        # last one on the same queue, even if planning fails.
+        path = []
+        try:
+            for segment in planner.generate_path():
+                worker_progress_queue.put((job_id, "segment", segment))
+                path.extend(segment)
+        finally:
+            worker_progress_queue.put((job_id, "end", None))
         return path
+    last_percent = [-1]
+
+    def progress(done, total):
+        percent = done * 100 // total if total else 100
+        if percent != last_percent[0]:
+            last_percent[0] = percent
+            worker_progress_queue.put((job_id, "progress", percent))
+    return planner.full_path(progress)
+
+def shutdown_planner_pool():
+    global planner_pool, job_progress_queue
+    with planner_pool_lock:
+        if planner_pool is not None:
+            planner_pool.shutdown(cancel_futures=True)
+            planner_pool = None
+            job_progress_queue.close()
+            job_progress_queue = None
+
+# Planner results keyed by a hash of the canonical wall configuration.
+# Entries are kept encoded (see encode_path) in an in-process LRU bounded
+# by bytes, and written through to the planner_cache table so they survive
+# restarts. The table has the same byte budget, dropping its oldest
+# entries first. Bump PLANNER_VERSION whenever the planners' output
+# changes, so paths cached by an older version are no longer served.
+PLANNER_VERSION = 2
+PLANNER_CACHE_BYTES = int(os.getenv("PLANNER_CACHE_BYTES", 64 * 1024 * 1024))
+PLANNER_CACHE_ENTRY_OVERHEAD = 128
+
+def planner_cache_key(wall_config: WallConfig, mode="astar", search="astar"):
+    obstacles = sorted((obs.x, obs.y, obs.width, obs.height) for obs in wall_config.obstacles)
+    canonical = json.dumps({
+        "width": wall_config.width,
+        "height": wall_config.height,
+        "resolution": GRID_RESOLUTION,
+        "obstacles": obstacles,
+        "planner": mode,
+        "search": search,
+        "version": PLANNER_VERSION
+    }, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class PlannerCache:
+    def __init__(self, max_bytes=PLANNER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        # Returns the cached path as an (n, 2) array, or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return decode_path(*entry)
+        row = db_pool.reader().execute(
+            "SELECT path_format, path_data FROM planner_cache WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, tuple(row))
+        return decode_path(*row)
+
+    def put(self, key, path_data):
+        # Returns the future of the write-through to the database
+        path_format, blob = encode_path(path_data)
+        with self._lock:
+            self._remember(key, (path_format, blob))
+        def write(conn):
+            # Keeps planner_cache_size in step, then drops the oldest rows
+            # (through idx_planner_cache_created_at) only while over budget
+            if conn.execute("SELECT 1 FROM planner_cache_size").fetchone() is None:
+                conn.execute(
+                    "INSERT INTO planner_cache_size (id, bytes) "
+                    "SELECT 0, COALESCE(SUM(length(key) + length(path_data) + ?), 0) FROM planner_cache",
+                    (PLANNER_CACHE_ENTRY_OVERHEAD,))
+            old = conn.execute(
+                "SELECT length(key) + length(path_data) + ? FROM planner_cache WHERE key = ?",
+                (PLANNER_CACHE_ENTRY_OVERHEAD, key)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO planner_cache (key, path_format, path_data) VALUES (?, ?, ?)",
+                         (key, path_format, blob))
+            conn.execute("UPDATE planner_cache_size SET bytes = bytes + ?",
+                         (self._size(key, (path_format, blob)) - (old[0] if old else 0),))
+            (total,) = conn.execute("SELECT bytes FROM planner_cache_size").fetchone()
+            while total > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, length(key) + length(path_data) + ? FROM planner_cache "
+                    "ORDER BY created_at, rowid LIMIT 64", (PLANNER_CACHE_ENTRY_OVERHEAD,)).fetchall()
+                if not oldest:
+                    break
+                for old_key, size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM planner_cache WHERE key = ?", (old_key,))
+                    conn.execute("UPDATE planner_cache_size SET bytes = bytes - ?", (size,))
+                    total -= size
+        return db_writer.submit(write)
+
+    def _remember(self, key, entry):
+        if key in self._entries:
+            self._bytes -= self._size(key, self._entries.pop(key))
+        size = self._size(key, entry)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key, old_entry)
+            self.evictions += 1
+
+    @staticmethod
+    def _size(key, entry):
+        return len(key) + len(entry[1]) + PLANNER_CACHE_ENTRY_OVERHEAD
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.memory_hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+planner_cache = PlannerCache()
+
+def save_trajectory(request: TrajectoryRequest, path_data, execution_time, encoded=None):
+    # Returns a future resolved with the new trajectory id. encoded is the
+    # (path_format, blob) pair from encode_path, if the caller has it.
+    points = np.asarray(path_data, dtype=np.float64).reshape(-1, 2)
+    path_format, blob = encoded or encode_path(points)
+    params = (
+        request.name,
+        request.wall_config.width,
+        request.wall_config.height,
+        json.dumps([obs.dict() for obs in request.wall_config.obstacles]),
+        execution_time,
+        *path_metadata(points)
+    )
+    columns = ", ".join(column for column, _ in TRAJECTORY_METADATA_COLUMNS)
+    placeholders = ", ".join("?" * len(params))
+
+    def insert(conn):
+        trajectory_id = conn.execute(f'''
+            INSERT INTO trajectories (name, wall_width, wall_height, obstacles, execution_time, {columns})
+            VALUES ({placeholders})
+        ''', params).lastrowid
+        conn.execute("INSERT INTO trajectory_paths (trajectory_id, path_format, path_data) VALUES (?, ?, ?)",
+                     (trajectory_id, path_format, blob))
+        return trajectory_id
+    return db_writer.submit(insert)
+
+def store_trajectory(request: TrajectoryRequest, path_data, execution_time):
+    # Encodes the path and queues its insert, returning (path_format, blob,
+    # future of the new id). Both steps scan every point, so handlers on
+    # the event loop run this in a thread.
+    encoded = encode_path(path_data)
+    return (*encoded, save_trajectory(request, path_data, execution_time, encoded))
+
+# Single flight: identical configurations already being planned, by cache
+# key. Concurrent requests for the same wall share one worker future, and
+# the result goes into the planner cache before the entry is dropped, so a
+# later request finds one or the other.
+inflight_plans = {}
+inflight_lock = threading.Lock()
+
+def plan_once(request: TrajectoryRequest, cache_key, job_id=None):
+    # Returns (future, coalesced)
+    with inflight_lock:
+        future = inflight_plans.get(cache_key)
+        if future is not None:
+            return future, True
+        future = submit_plan(
+            request.wall_config.width,
+            request.wall_config.height,
+            request.wall_config.obstacles,
+            request.planner,
+            request.search,
+            job_id
+        )
+        inflight_plans[cache_key] = future
+
+    def done(f):
+        try:
+            if not f.cancelled() and f.exception() is None:
+                planner_cache.put(cache_key, f.result())
+        except Exception as e:
+            logger.error(f"Planner cache write failed: {str(e)}")
+        with inflight_lock:
+            if inflight_plans.get(cache_key) is f:
+                del inflight_plans[cache_key]
+    future.add_done_callback(done)
+    return future, False
+
+def finish_job(job_id, request: TrajectoryRequest, start_time, future, cache_hit=False, coalesced=False):
+    try:
+        path_data = future.result()
+        trajectory_id = save_trajectory(request, path_data, time.time() - start_time).result()
+        publish_event(f"🛠️ Trajectory created: {request.name} ({len(path_data)} points)")
+        update = {
+            "status": "done",
+            "progress": 100,
+            "trajectory_id": trajectory_id,
+            "path_points": len(path_data),
+            "cache_hit": cache_hit,
+            "coalesced": coalesced
+        }
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        update = {"status": "failed", "error": str(e)}
+    with jobs_lock:
+        jobs[job_id].update(update, finished_at=time.time(), execution_time=time.time() - start_time)
+
+def submit_job(request: TrajectoryRequest):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with jobs_lock:
+        for stale in [k for k, job in jobs.items() if now - job.get("finished_at", now) > JOB_RETENTION_SECONDS]:
+            del jobs[stale]
+        jobs[job_id] = {"id": job_id, "name": request.name, "status": "queued", "progress": 0, "submitted_at": now}
+    cache_key = planner_cache_key(request.wall_config, request.planner, request.search)
+    cached = planner_cache.get(cache_key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        job_executor.submit(finish_job, job_id, request, now, future, True)
+        return job_id
+    # A job that joins another request's plan only sees progress at the end
+    try:
+        future, coalesced = plan_once(request, cache_key, job_id)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        with jobs_lock:
+            jobs[job_id].update(status="failed", error=str(e), finished_at=time.time(), execution_time=time.time() - now)
+        return job_id
+    # Persisting may block on the DB and Redis, so keep it off the pool's
+    # result-handling thread.
+    future.add_done_callback(lambda f: job_executor.submit(finish_job, job_id, request, now, f, False, coalesced))
+    return job_id
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -176,121 +1567,549 @@ async def root():
         return HTMLResponse(content="<h1>index.html not found</h1>", status_code=404)
 
 @app.post("/api/trajectories", response_model=dict)
-async def create_trajectory(request: TrajectoryRequest):
+async def create_trajectory(
+    request: TrajectoryRequest,
+    background: bool = False,
+    include_path: bool = False,
+    path_encoding: Literal["json", "rle"] = "rle"
+):
+    # include_path returns the planned path in the response, so clients
+    # don't need a follow-up GET (ignored for background jobs)
     start_time = time.time()
     try:
-        planner = CoveragePlannerSmart(request.wall_config.width, request.wall_config.height, request.wall_config.obstacles)
-        path_data = planner.generate_path()
-        with db_lock:
-            db = get_db_connection()
-            cursor = db.cursor()
-            cursor.execute('''
-                INSERT INTO trajectories (name, wall_width, wall_height, obstacles, path_data, execution_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                request.name,
-                request.wall_config.width,
-                request.wall_config.height,
-                json.dumps([obs.dict() for obs in request.wall_config.obstacles]),
-                json.dumps(path_data),
-                time.time() - start_time
-            ))
-            db.commit()
-            trajectory_id = cursor.lastrowid
-            db.close()
+        if background:
+            job_id = await asyncio.to_thread(submit_job, request)
+            return JSONResponse(status_code=202, content={
+                "job_id": job_id,
+                "status": "queued",
+                "message": "Trajectory planning queued"
+            })
+        # Cache lookups, encoding and rendering touch the whole path, so they
+        # run in threads to keep the event loop free for other requests
+        cache_key = planner_cache_key(request.wall_config, request.planner, request.search)
+        path_data = await asyncio.to_thread(planner_cache.get, cache_key)
+        cache_hit, coalesced = path_data is not None, False
+        if not cache_hit:
+            future, coalesced = plan_once(request, cache_key)
+            # Shielded so a disconnecting client can't cancel a shared plan
+            path_data = await asyncio.shield(asyncio.wrap_future(future))
+        path_format, blob, saved = await asyncio.to_thread(
+            store_trajectory, request, path_data, time.time() - start_time)
+        trajectory_id = await asyncio.wrap_future(saved)
         publish_event(f"🛠️ Trajectory created: {request.name} ({len(path_data)} points)")
-        return {
+        result = {
             "id": trajectory_id,
             "message": "Trajectory created successfully",
             "path_points": len(path_data),
-            "execution_time": time.time() - start_time
+            "execution_time": time.time() - start_time,
+            "cache_hit": cache_hit,
+            "coalesced": coalesced
         }
+        if not include_path:
+            return result
+        if path_encoding == "rle" and path_format == PATH_FORMAT_RLE:
+            return trajectory_json_response(result, "path_rle", json.dumps(rle_to_text(blob), separators=(",", ":")))
+        path_json = await asyncio.to_thread(path_to_json, path_format, blob)
+        return trajectory_json_response(result, "path_data", path_json)
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def ndjson_line(obj):
+    return json.dumps(obj, separators=(",", ":")) + "\n"
+
+async def stream_trajectory_lines(request: TrajectoryRequest):
+    start_time = time.time()
+    cache_key = planner_cache_key(request.wall_config, request.planner, request.search)
+    path_data = await asyncio.to_thread(planner_cache.get, cache_key)
+    cache_hit = path_data is not None
+    if cache_hit:
+        yield await asyncio.to_thread(lambda: ndjson_line({"type": "segment", "index": 0, "points": path_data.tolist()}))
+    else:
+        stream_id = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        segments = asyncio.Queue()
+        with streams_lock:
+            streams[stream_id] = lambda segment: loop.call_soon_threadsafe(segments.put_nowait, segment)
+
+        def planned(f):
+            # A worker that dies, or a plan cancelled at shutdown, never
+            # sends "end", so end the stream here instead
+            if f.cancelled() or f.exception() is not None:
+                with streams_lock:
+                    listener = streams.get(stream_id)
+                if listener:
+                    listener(None)
+        try:
+            future = submit_plan(
+                request.wall_config.width,
+                request.wall_config.height,
+                request.wall_config.obstacles,
+                request.planner,
+                request.search,
+                stream_id,
+                True
+            )
+            future.add_done_callback(planned)
+            index = 0
+            while (segment := await segments.get()) is not None:
+                yield ndjson_line({"type": "segment", "index": index, "points": segment})
+                index += 1
+            if future.cancelled():
+                raise RuntimeError("Planning was cancelled")
+            path_data = await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.error(f"Stream error: {str(e)}")
+            yield ndjson_line({"type": "error", "detail": str(e)})
+            return
+        finally:
+            with streams_lock:
+                streams.pop(stream_id, None)
+        await asyncio.to_thread(planner_cache.put, cache_key, path_data)
+    try:
+        _, _, saved = await asyncio.to_thread(store_trajectory, request, path_data, time.time() - start_time)
+        trajectory_id = await asyncio.wrap_future(saved)
+    except Exception as e:
+        logger.error(f"Stream error: {str(e)}")
+        yield ndjson_line({"type": "error", "detail": str(e)})
+        return
+    publish_event(f"🛠️ Trajectory created: {request.name} ({len(path_data)} points)")
+    yield ndjson_line({
+        "type": "done",
+        "id": trajectory_id,
+        "path_points": len(path_data),
+        "execution_time": time.time() - start_time,
+        "cache_hit": cache_hit
+    })
+
+@app.post("/api/trajectories/stream")
+async def create_trajectory_stream(request: TrajectoryRequest):
+    # Plans like POST /api/trajectories but sends the path as NDJSON while
+    # it is planned: one "segment" line per row sweep or transition, then a
+    # "done" line with the id once the trajectory is stored.
+    return StreamingResponse(stream_trajectory_lines(request), media_type="application/x-ndjson")
+
+@app.get("/api/jobs/{job_id}", response_model=dict)
+async def get_job(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return dict(job)
+
+@app.get("/api/planner/cache", response_model=dict)
+async def get_planner_cache_stats():
+    return planner_cache.stats()
+
+@app.get("/api/events/stats", response_model=dict)
+async def get_event_stats():
+    return event_outbox.stats()
+
 @app.delete("/api/trajectories/{trajectory_id}")
 async def delete_trajectory(trajectory_id: int):
     try:
-        with db_lock:
-            db = get_db_connection()
-            cursor = db.cursor()
-            cursor.execute("DELETE FROM trajectories WHERE id = ?", (trajectory_id,))
-            deleted = cursor.rowcount
-            db.commit()
-            db.close()
-            if deleted == 0:
-                raise HTTPException(status_code=404, detail="Trajectory not found")
+        deleted = await asyncio.wrap_future(db_writer.submit(
+            lambda conn: conn.execute("DELETE FROM trajectories WHERE id = ?", (trajectory_id,)).rowcount
+        ))
+        if deleted == 0:
+            raise HTTPException(status_code=404, detail="Trajectory not found")
         publish_event(f"🗑️ Trajectory deleted: ID {trajectory_id}")
         return {"message": "Trajectory deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Delete error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def encode_cursor(created_at, trajectory_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, trajectory_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, trajectory_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(trajectory_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def prefix_upper_bound(prefix):
+    # Smallest string above every string starting with prefix, or None if
+    # there is none (prefix is all U+10FFFF). Skips the surrogate range,
+    # which can't be stored.
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(0xE000 if last == 0xD7FF else last + 1)
+        prefix = prefix[:-1]
+    return None
+
+def created_at_param(value: Optional[datetime]):
+    # created_at is stored as naive UTC; naive inputs are taken as UTC
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
 @app.get("/api/trajectories", response_model=List[dict])
-async def get_trajectories():
+def get_trajectories(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    min_width: Optional[float] = None,
+    max_width: Optional[float] = None,
+    min_height: Optional[float] = None,
+    max_height: Optional[float] = None
+):
+    # Keyset pagination on (created_at, id), newest first. The next page's
+    # cursor is returned in the X-Next-Cursor header so the body stays a
+    # plain list. A name prefix is served from idx_name_listing, which
+    # isn't in listing order: SQLite seeks to the matching names and keeps
+    # the top `limit` of them, so that filter costs time in the number of
+    # matching rows (not the table size) and memory in `limit`.
     try:
-        with db_lock:
-            db = get_db_connection()
-            cursor = db.cursor()
-            cursor.execute('SELECT id, name, wall_width, wall_height, created_at, execution_time FROM trajectories ORDER BY created_at DESC')
-            rows = cursor.fetchall()
-            db.close()
-            return [
-                {
-                    "id": row[0],
-                    "name": row[1],
-                    "wall_width": row[2],
-                    "wall_height": row[3],
-                    "created_at": row[4],
-                    "execution_time": row[5]
-                } for row in rows
-            ]
+        where, params = [], []
+        if cursor:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        if name_prefix:
+            where.append("name >= ?")
+            params.append(name_prefix)
+            upper = prefix_upper_bound(name_prefix)
+            if upper is not None:
+                where.append("name < ?")
+                params.append(upper)
+        for column, op, value in (
+            ("created_at", ">=", created_at_param(created_after)),
+            ("created_at", "<", created_at_param(created_before)),
+            ("wall_width", ">=", min_width),
+            ("wall_width", "<=", max_width),
+            ("wall_height", ">=", min_height),
+            ("wall_height", "<=", max_height),
+        ):
+            if value is not None:
+                where.append(f"{column} {op} ?")
+                params.append(value)
+        sql = 'SELECT id, name, wall_width, wall_height, created_at, execution_time FROM trajectories'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        rows = db_pool.reader().execute(sql, (*params, limit + 1)).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][4], rows[-1][0])
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "wall_width": row[2],
+                "wall_height": row[3],
+                "created_at": row[4],
+                "execution_time": row[5]
+            } for row in rows
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Binary trajectory responses, chosen with the Accept header. Both carry the
+# path as little-endian float32 (x, y) pairs that clients can map straight
+# into an array: octet-stream is the bare array with metadata in headers,
+# msgpack is a map of the metadata plus the array as a bin field.
+MEDIA_JSON = "application/json"
+MEDIA_OCTET_STREAM = "application/octet-stream"
+MEDIA_MSGPACK = "application/x-msgpack"
+POINT_FORMAT_F32 = "float32-le"
+
+def _accept_qualities(header):
+    # (token, q) pairs from an Accept or Accept-Encoding header
+    for part in (header or "").split(","):
+        token, *params = [item.strip().lower() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if token:
+            yield token, q
+
+def negotiate_media_type(accept):
+    # Highest-q supported type; JSON for wildcards and anything unknown
+    best, best_q = MEDIA_JSON, 0.0
+    for media_type, q in _accept_qualities(accept):
+        if media_type in ("*/*", "application/*"):
+            media_type = MEDIA_JSON
+        if media_type in (MEDIA_JSON, MEDIA_OCTET_STREAM, MEDIA_MSGPACK) and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+def _msgpack_length(out, length, small_tag, small_limit, tags):
+    if length < small_limit:
+        out.append(small_tag | length)
+        return
+    for tag, fmt in tags:
+        if length < 1 << (8 * struct.calcsize(fmt)):
+            out += struct.pack(f">B{fmt}", tag, length)
+            return
+    raise ValueError("msgpack object too large")
+
+def msgpack_pack(obj, out=None):
+    # Enough of MessagePack for response envelopes: nil, bool, int, float,
+    # str, bytes, list and dict
+    out = bytearray() if out is None else out
+    if obj is None:
+        out.append(0xc0)
+    elif isinstance(obj, bool):
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, int):
+        if -32 <= obj < 128:
+            out += struct.pack(">b", obj) if obj < 0 else bytes([obj])
+        else:
+            out += struct.pack(">Bq", 0xd3, obj)
+    elif isinstance(obj, float):
+        out += struct.pack(">Bd", 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _msgpack_length(out, len(data), 0xa0, 32, [(0xd9, "B"), (0xda, "H"), (0xdb, "I")])
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        _msgpack_length(out, len(obj), 0xc4, 0, [(0xc4, "B"), (0xc5, "H"), (0xc6, "I")])
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        _msgpack_length(out, len(obj), 0x90, 16, [(0xdc, "H"), (0xdd, "I")])
+        for item in obj:
+            msgpack_pack(item, out)
+    elif isinstance(obj, dict):
+        _msgpack_length(out, len(obj), 0x80, 16, [(0xde, "H"), (0xdf, "I")])
+        for key, value in obj.items():
+            msgpack_pack(key, out)
+            msgpack_pack(value, out)
+    else:
+        raise TypeError(f"Cannot pack {type(obj).__name__}")
+    return bytes(out)
+
+def trajectory_headers(fields, media_type):
+    headers = {"Vary": "Accept, Accept-Encoding", "Cache-Control": "no-cache"}
+    if media_type == MEDIA_OCTET_STREAM:
+        headers.update({
+            "X-Trajectory-Id": str(fields["id"]),
+            "X-Point-Count": str(fields["point_count"]),
+            "X-Point-Format": POINT_FORMAT_F32,
+            "X-Path-Length": repr(fields["path_length"]),
+            "X-Content-Hash": fields["content_hash"] or ""
+        })
+        if fields["bounds"]:
+            headers["X-Bounds"] = ",".join(repr(value) for value in fields["bounds"])
+    return headers
+
+def trajectory_binary_response(fields, media_type, path_format, blob):
+    if path_format == PATH_FORMAT_F32:
+        points = blob
+    else:
+        points = decode_path(path_format, blob).astype("<f4").tobytes()
+    if media_type == MEDIA_MSGPACK:
+        points = msgpack_pack({**fields, "point_format": POINT_FORMAT_F32, "path_data": points})
+    return Response(content=points, media_type=media_type, headers=trajectory_headers(fields, media_type))
+
+def trajectory_json_response(fields, path_key=None, path_json=None):
+    # The path is already JSON text, so it is spliced into the small
+    # metadata envelope instead of being validated and re-serialized
+    # through the response model.
+    body = json.dumps(fields, separators=(",", ":"))
+    if path_key:
+        body = f'{body[:-1]},"{path_key}":{path_json}}}'
+    return Response(content=body, media_type=MEDIA_JSON, headers=trajectory_headers(fields, MEDIA_JSON))
+
+# Conditional GET and compression. Trajectories never change once stored,
+# so a strong ETag built from the id, the content hash and the
+# representation identifies a response body exactly. Compressed bodies of
+# path-carrying responses are computed once and kept in trajectory_bodies.
+COMPRESS_MIN_POINTS = 64
+# zstd's default level, set explicitly so both implementations match
+ZSTD_LEVEL = 3
+CONTENT_CODINGS = {"gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+try:
+    from compression import zstd  # Python 3.14+
+    CONTENT_CODINGS["zstd"] = lambda body: zstd.compress(body, level=ZSTD_LEVEL)
+except ImportError:
+    try:
+        import zstandard
+        CONTENT_CODINGS["zstd"] = lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    except ImportError:
+        pass
+
+def negotiate_content_encoding(accept_encoding):
+    # Preferred coding we can produce, zstd ahead of gzip on equal q
+    best, best_q = None, 0.0
+    for coding in ("zstd", "gzip"):
+        q = max((q for token, q in _accept_qualities(accept_encoding) if token in (coding, "*")), default=0.0)
+        if coding in CONTENT_CODINGS and q > best_q:
+            best, best_q = coding, q
+    return best
+
+def trajectory_etag(fields, variant, coding=None):
+    tag = f'{fields["id"]}-{(fields["content_hash"] or "")[:16]}-{variant}'
+    return f'"{tag}-{coding}"' if coding else f'"{tag}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def render_trajectory(conn, fields, encoding, media_type, include_path):
+    if not include_path:
+        return trajectory_json_response(fields)
+    path_row = conn.execute(
+        "SELECT path_format, path_data FROM trajectory_paths WHERE trajectory_id = ?", (fields["id"],)
+    ).fetchone()
+    if not path_row:
+        raise HTTPException(status_code=404, detail="Trajectory not found")
+    path_format, blob = path_row
+    if media_type != MEDIA_JSON:
+        return trajectory_binary_response(fields, media_type, path_format, blob)
+    if encoding == "rle":
+        if path_format != PATH_FORMAT_RLE:
+            path_format, blob = encode_path(decode_path(path_format, blob))
+        if path_format != PATH_FORMAT_RLE:
+            raise HTTPException(status_code=400, detail="Trajectory path is not on the planner grid")
+        return trajectory_json_response(fields, "path_rle", json.dumps(rle_to_text(blob), separators=(",", ":")))
+    return trajectory_json_response(fields, "path_data", path_to_json(path_format, blob))
+
+@app.get(
+    "/api/trajectories/{trajectory_id}",
+    response_model=Union[TrajectoryResponse, TrajectoryRLEResponse, TrajectoryMetadata],
+    responses={200: {"content": {MEDIA_OCTET_STREAM: {}, MEDIA_MSGPACK: {}}}}
+)
+def get_trajectory(
+    trajectory_id: int,
+    encoding: Literal["json", "rle"] = "json",
+    include_path: bool = True,
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    try:
+        conn = db_pool.reader()
+        row = conn.execute('''
+            SELECT id, name, wall_width, wall_height, obstacles, created_at, execution_time,
+                   point_count, path_length, min_x, min_y, max_x, max_y, content_hash
+            FROM trajectories WHERE id = ?
+        ''', (trajectory_id,)).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Trajectory not found")
+        fields = dict(
+            id=row[0],
+            name=row[1],
+            wall_width=row[2],
+            wall_height=row[3],
+            obstacles=json.loads(row[4]),
+            created_at=row[5],
+            execution_time=row[6],
+            point_count=row[7],
+            path_length=row[8],
+            bounds=list(row[9:13]) if row[7] else None,
+            content_hash=row[13]
+        )
+        media_type = negotiate_media_type(accept) if include_path and encoding == "json" else MEDIA_JSON
+        if not include_path:
+            variant = "meta"
+        else:
+            variant = encoding if media_type == MEDIA_JSON else media_type.rsplit("/", 1)[1]
+        coding = None
+        if include_path and fields["point_count"] >= COMPRESS_MIN_POINTS:
+            coding = negotiate_content_encoding(accept_encoding)
+        etag = trajectory_etag(fields, variant, coding)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, **trajectory_headers(fields, None)})
+
+        headers = trajectory_headers(fields, media_type)
+        headers["ETag"] = etag
+        if not coding:
+            response = render_trajectory(conn, fields, encoding, media_type, include_path)
+            response.headers["ETag"] = etag
+            return response
+        headers["Content-Encoding"] = coding
+        cached = conn.execute(
+            "SELECT body FROM trajectory_bodies WHERE trajectory_id = ? AND variant = ? AND coding = ?",
+            (trajectory_id, variant, coding)
+        ).fetchone()
+        if cached:
+            return Response(content=cached[0], media_type=media_type, headers=headers)
+        body = CONTENT_CODINGS[coding](render_trajectory(conn, fields, encoding, media_type, include_path).body)
+        db_writer.submit(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO trajectory_bodies (trajectory_id, variant, coding, body) VALUES (?, ?, ?, ?)",
+            (trajectory_id, variant, coding, body)
+        ))
+        return Response(content=body, media_type=media_type, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/trajectories/{trajectory_id}", response_model=TrajectoryResponse)
-async def get_trajectory(trajectory_id: int):
+@app.get("/api/trajectories/{trajectory_id}/points", response_model=dict)
+def get_trajectory_points(
+    trajectory_id: int,
+    start: int = Query(0, ge=0),
+    count: int = Query(1000, ge=1, le=10000)
+):
     try:
-        with db_lock:
-            db = get_db_connection()
-            cursor = db.cursor()
-            cursor.execute('SELECT * FROM trajectories WHERE id = ?', (trajectory_id,))
-            row = cursor.fetchone()
-            db.close()
-            if not row:
-                raise HTTPException(status_code=404, detail="Trajectory not found")
-            return TrajectoryResponse(
-                id=row[0],
-                name=row[1],
-                wall_width=row[2],
-                wall_height=row[3],
-                obstacles=json.loads(row[4]),
-                path_data=json.loads(row[5]),
-                created_at=row[6],
-                execution_time=row[7]
-            )
+        conn = db_pool.reader()
+        row = conn.execute('''
+            SELECT t.point_count, p.path_format
+            FROM trajectories t JOIN trajectory_paths p ON p.trajectory_id = t.id
+            WHERE t.id = ?
+        ''', (trajectory_id,)).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Trajectory not found")
+        points = read_path_window(conn, trajectory_id, row[1], start, count)
+        return {
+            "trajectory_id": trajectory_id,
+            "start": start,
+            "total": row[0],
+            "points": points.tolist()
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.websocket("/ws/updates")
 async def websocket_endpoint(websocket: WebSocket):
+    client_queue = event_hub.subscribe()
     await websocket.accept()
-    pubsub = redis_client.pubsub()
-    pubsub.subscribe(REDIS_CHANNEL)
-    try:
+
+    async def forward():
         while True:
-            message = pubsub.get_message()
-            if message and message["type"] == "message":
-                await websocket.send_text(message["data"])
-            await asyncio.sleep(0.2)
+            message = await client_queue.get()
+            if message is None:
+                await websocket.close(code=1013)
+                return
+            await websocket.send_text(message)
+
+    async def watch():
+        # Clients never send anything; reading just notices them leaving
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(watch())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
     finally:
-        await websocket.close()
-
-
-
-
+        for task in tasks:
+            task.cancel()
+        event_hub.unsubscribe(client_queue)
@@ -1,30 +1,52 @@
 import pytest
+import asyncio
 import json
 import os
+import signal
 import sqlite3
+import struct
+import threading
+import time
+import numpy as np
 from fastapi.testclient import TestClient
-from main import app, init_db
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Test database setup (must be configured before main opens the database)
+TEST_DB = "test_robot_trajectories.db"
+os.environ["ROBOT_DB_PATH"] = TEST_DB
+
+import main
+from main import app, init_db, db_pool, db_writer, CoveragePlannerSmart, Obstacle, get_planner_pool, plan_path
+from main import TrajectoryRequest, TrajectoryResponse, save_trajectory, path_to_json, msgpack_pack, negotiate_media_type, PlannerCache, planner_cache, planner_cache_key, plan_once
+from main import EventHub, event_hub, EventOutbox, InProcessEventBus, RedisEventBus, create_event_bus
+from main import DB_NAME, PATH_FORMAT_F32, PATH_FORMAT_RLE, encode_path, decode_path, encode_rle, decode_rle, decode_rle_window, rle_to_text, read_path_window
 
 # Create test client
 client = TestClient(app)
 
-# Test database setup
-TEST_DB = "test_robot_trajectories.db"
+def remove_test_db():
+    # Let queued background writes land before the file goes away
+    db_writer.submit(lambda conn: None).result(timeout=10)
+    db_pool.close_all()
+    for path in (TEST_DB, TEST_DB + "-wal", TEST_DB + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
 
 @pytest.fixture(autouse=True)
 def setup_test_db():
     """Setup test database before each test"""
     # Remove existing test database
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+    remove_test_db()
     
     # Initialize test database
     init_db()
+    planner_cache.clear()
     yield
     
     # Cleanup after test
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+    remove_test_db()
 
 class TestAPI:
     """Test suite for Wall Robot Control System API"""
@@ -62,6 +84,21 @@ class TestAPI:
         assert result["path_points"] > 0
         assert result["execution_time"] > 0
 
+    def test_create_trajectory_with_inline_path(self):
+        """Test POST can return the planned path without a follow-up GET"""
+        trajectory_data = {"name": "Inline", "wall_config": {"width": 1.0, "height": 0.5, "obstacles": []}}
+        result = client.post("/api/trajectories?include_path=true", json=trajectory_data).json()
+        stored = client.get(f"/api/trajectories/{result['id']}?encoding=rle").json()
+        assert result["path_rle"] == stored["path_rle"]
+        assert result["path_points"] == stored["point_count"]
+
+        result = client.post("/api/trajectories?include_path=true&path_encoding=json", json=trajectory_data).json()
+        stored = client.get(f"/api/trajectories/{result['id']}").json()
+        assert result["path_data"] == stored["path_data"]
+
+        result = client.post("/api/trajectories", json=trajectory_data).json()
+        assert "path_rle" not in result and "path_data" not in result
+
     def test_create_trajectory_validation(self):
         """Test trajectory creation with invalid data"""
         invalid_data = {
@@ -109,6 +146,47 @@ class TestAPI:
         assert len(trajectories) == 1
         assert trajectories[0]["name"] == "Test Trajectory 1"
 
+    def test_get_trajectories_keyset_pagination(self):
+        """Test listing pages with a cursor and filters"""
+        for i, width in enumerate([1.0, 2.0, 1.0, 2.0, 1.0]):
+            trajectory_data = {
+                "name": f"{'Page' if i < 4 else 'Other'} {i}",
+                "wall_config": {"width": width, "height": 1.0, "obstacles": []}
+            }
+            assert client.post("/api/trajectories", json=trajectory_data).status_code == 200
+
+        first = client.get("/api/trajectories?limit=2")
+        assert [t["name"] for t in first.json()] == ["Other 4", "Page 3"]
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get(f"/api/trajectories?limit=2&cursor={cursor}")
+        assert [t["name"] for t in second.json()] == ["Page 2", "Page 1"]
+        last = client.get(f"/api/trajectories?limit=2&cursor={second.headers['X-Next-Cursor']}")
+        assert [t["name"] for t in last.json()] == ["Page 0"]
+        assert "X-Next-Cursor" not in last.headers
+
+        filtered = client.get("/api/trajectories?name_prefix=Page&min_width=1.5").json()
+        assert [t["name"] for t in filtered] == ["Page 3", "Page 1"]
+        assert client.get("/api/trajectories?cursor=bogus").status_code == 400
+
+    def test_get_trajectories_filter_edge_cases(self):
+        """Test offset-aware date filters and name prefixes at the top of Unicode"""
+        for name in ["Edge", "Edge\U0010ffff"]:
+            trajectory_data = {"name": name, "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+            assert client.post("/api/trajectories", json=trajectory_data).status_code == 200
+
+        plus_five = timezone(timedelta(hours=5))
+        hour_ago = (datetime.now(plus_five) - timedelta(hours=1)).isoformat()
+        in_an_hour = (datetime.now(plus_five) + timedelta(hours=1)).isoformat()
+        response = client.get("/api/trajectories", params={"created_after": hour_ago})
+        assert len(response.json()) == 2
+        response = client.get("/api/trajectories", params={"created_after": in_an_hour})
+        assert response.json() == []
+
+        for prefix, expected in [("Edge\U0010ffff", 1), ("\U0010ffff", 0), ("Edg\ud7ff", 0)]:
+            response = client.get("/api/trajectories", params={"name_prefix": prefix})
+            assert response.status_code == 200
+            assert len(response.json()) == expected
+
     def test_get_specific_trajectory(self):
         """Test getting a specific trajectory by ID"""
         # Create a trajectory first
@@ -144,6 +222,159 @@ class TestAPI:
         assert len(trajectory["obstacles"]) == 1
         assert len(trajectory["path_data"]) > 0
 
+    def test_get_trajectory_rle_encoding(self):
+        """Test the optional run-length response encoding"""
+        trajectory_data = {
+            "name": "RLE Test",
+            "wall_config": {"width": 1.0, "height": 0.5, "obstacles": []}
+        }
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+
+        response = client.get(f"/api/trajectories/{trajectory_id}?encoding=rle")
+        assert response.status_code == 200
+        trajectory = response.json()
+        assert "path_data" not in trajectory
+        assert trajectory["path_rle"]["start"] == [0, 0]
+        assert trajectory["path_rle"]["moves"].startswith("R19S1D1L19")
+
+    def test_get_trajectory_body_matches_response_model(self):
+        """Test the pre-encoded response is what the response model would produce"""
+        trajectory_data = {
+            "name": "Pre-encoded",
+            "wall_config": {"width": 2.0, "height": 1.0, "obstacles": [{"x": 0.5, "y": 0.2, "width": 0.3, "height": 0.3}]}
+        }
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+
+        response = client.get(f"/api/trajectories/{trajectory_id}")
+        assert response.headers["content-type"] == "application/json"
+        model = TrajectoryResponse.model_validate_json(response.content)
+        assert model.model_dump() == response.json()
+
+    def test_get_trajectory_binary_encodings(self):
+        """Test Accept selects float32 octet-stream or msgpack bodies"""
+        trajectory_data = {"name": "Binary", "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+        path = client.get(f"/api/trajectories/{trajectory_id}").json()["path_data"]
+        expected = np.asarray(path, dtype="<f4").tobytes()
+
+        response = client.get(f"/api/trajectories/{trajectory_id}", headers={"Accept": "application/octet-stream"})
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.headers["x-point-count"] == str(len(path))
+        assert response.content == expected
+        assert np.frombuffer(response.content, dtype="<f4").reshape(-1, 2).shape == (len(path), 2)
+
+        response = client.get(f"/api/trajectories/{trajectory_id}", headers={"Accept": "application/x-msgpack"})
+        assert response.headers["content-type"] == "application/x-msgpack"
+        assert response.content.endswith(expected)
+        assert len(response.content) < len(json.dumps(path)) / 2
+
+    def test_accept_negotiation_and_msgpack_packing(self):
+        """Test q-values pick the encoding and the packer emits standard tags"""
+        assert negotiate_media_type(None) == "application/json"
+        assert negotiate_media_type("text/html, */*;q=0.8") == "application/json"
+        assert negotiate_media_type("application/json;q=0.5, application/octet-stream") == "application/octet-stream"
+        assert negotiate_media_type("application/x-msgpack;q=0.9, application/json;q=0.1") == "application/x-msgpack"
+
+        assert msgpack_pack({"a": 1, "b": [None, True, -1]}) == b"\x82\xa1a\x01\xa1b\x93\xc0\xc3\xff"
+        assert msgpack_pack(1.5) == b"\xcb" + struct.pack(">d", 1.5)
+        assert msgpack_pack(b"xy") == b"\xc4\x02xy"
+        assert msgpack_pack("x" * 40)[:2] == b"\xd9\x28"
+        assert msgpack_pack(list(range(20)))[:3] == b"\xdc\x00\x14"
+
+    def test_conditional_get_and_cached_compression(self):
+        """Test ETags give 304s and gzip bodies are compressed once and reused"""
+        trajectory_data = {"name": "Conditional", "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+        url = f"/api/trajectories/{trajectory_id}"
+
+        plain = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.json() == plain.json()
+        assert compressed.headers["etag"] != plain.headers["etag"]
+
+        etag = compressed.headers["etag"]
+        not_modified = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == etag
+
+        db_writer.submit(lambda conn: None).result(timeout=10)
+        stored = db_pool.reader().execute(
+            "SELECT variant, coding FROM trajectory_bodies WHERE trajectory_id = ?", (trajectory_id,)).fetchall()
+        assert stored == [("json", "gzip")]
+        again = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert again.content == compressed.content
+
+        binary = client.get(url, headers={"Accept": "application/octet-stream", "If-None-Match": etag})
+        assert binary.status_code == 200
+
+        client.delete(url)
+        count = db_pool.reader().execute("SELECT COUNT(*) FROM trajectory_bodies").fetchone()[0]
+        assert count == 0
+
+    def test_stream_trajectory_ndjson(self):
+        """Test the streaming endpoint sends segments and then stores the path"""
+        trajectory_data = {
+            "name": "Streamed",
+            "wall_config": {"width": 2.0, "height": 1.0, "obstacles": [{"x": 0.5, "y": 0.3, "width": 0.4, "height": 0.3}]}
+        }
+        for expected_cache_hit in (False, True):
+            with client.stream("POST", "/api/trajectories/stream", json=trajectory_data) as response:
+                assert response.headers["content-type"] == "application/x-ndjson"
+                lines = [json.loads(line) for line in response.iter_lines() if line]
+
+            segments, done = lines[:-1], lines[-1]
+            assert done["type"] == "done"
+            assert done["cache_hit"] is expected_cache_hit
+            assert [line["index"] for line in segments] == list(range(len(segments)))
+            points = [point for line in segments for point in line["points"]]
+            assert points == client.get(f"/api/trajectories/{done['id']}").json()["path_data"]
+        assert done["path_points"] == len(points)
+
+    def test_create_keeps_path_work_off_the_event_loop(self, monkeypatch):
+        """Test cache lookups, encoding, metadata and inline JSON run outside the event loop"""
+        calls = []
+
+        def off_loop(name, fn):
+            def wrapper(*args, **kwargs):
+                with pytest.raises(RuntimeError):
+                    asyncio.get_running_loop()
+                calls.append(name)
+                return fn(*args, **kwargs)
+            return wrapper
+        for name in ("encode_path", "path_metadata", "path_to_json"):
+            monkeypatch.setattr(main, name, off_loop(name, getattr(main, name)))
+        monkeypatch.setattr(planner_cache, "get", off_loop("get", planner_cache.get))
+
+        trajectory_data = {"name": "Off Loop", "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+        response = client.post("/api/trajectories?include_path=true&path_encoding=json", json=trajectory_data)
+        assert response.status_code == 200
+        assert len(response.json()["path_data"]) == response.json()["path_points"]
+        with client.stream("POST", "/api/trajectories/stream", json=trajectory_data) as response:
+            assert json.loads(list(response.iter_lines())[-1])["type"] == "done"
+        assert {"encode_path", "path_metadata", "path_to_json", "get"} <= set(calls)
+
+    def test_stream_ends_with_error_when_worker_dies(self):
+        """Test a stream whose worker is killed ends with an error line instead of hanging"""
+        def kill_workers():
+            deadline = time.time() + 30
+            while not main.streams and time.time() < deadline:
+                time.sleep(0.01)
+            for pid in list(get_planner_pool()._processes):
+                os.kill(pid, signal.SIGKILL)
+        killer = threading.Thread(target=kill_workers)
+        killer.start()
+
+        trajectory_data = {"name": "Killed", "wall_config": {"width": 20.0, "height": 10.0, "obstacles": []}}
+        with client.stream("POST", "/api/trajectories/stream", json=trajectory_data) as response:
+            lines = [json.loads(line) for line in response.iter_lines() if line]
+        killer.join()
+
+        assert lines[-1]["type"] == "error"
+        assert client.get("/api/trajectories").json() == []
+
     def test_get_nonexistent_trajectory(self):
         """Test getting a trajectory that doesn't exist"""
         response = client.get("/api/trajectories/999")
@@ -232,8 +463,6 @@ class TestAPI:
 
     def test_response_time_performance(self):
         """Test API response times"""
-        import time
-        
         trajectory_data = {
             "name": "Performance Test",
             "wall_config": {
@@ -303,5 +532,538 @@ class TestAPI:
         trajectories = response.json()
         assert len(trajectories) == 0
 
+    def test_planning_runs_in_process_pool(self):
+        """Test planning is dispatched to the worker process pool"""
+        obstacles = [Obstacle(x=0.5, y=0.5, width=0.5, height=0.5)]
+        future = get_planner_pool().submit(plan_path, 2.0, 2.0, obstacles, "boustrophedon")
+
+        assert future.result(timeout=30) == CoveragePlannerSmart(2.0, 2.0, obstacles, "boustrophedon").full_path()
+
+    def test_background_job_lifecycle(self):
+        """Test job mode returns immediately and reports progress until done"""
+        trajectory_data = {
+            "name": "Background Job",
+            "wall_config": {
+                "width": 3.0,
+                "height": 3.0,
+                "obstacles": [{"x": 1.0, "y": 1.0, "width": 0.5, "height": 0.5}]
+            }
+        }
+
+        response = client.post("/api/trajectories?background=true", json=trajectory_data)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        deadline = time.time() + 30
+        while True:
+            job = client.get(f"/api/jobs/{job_id}").json()
+            assert job["status"] in ["queued", "running", "done"]
+            assert 0 <= job["progress"] <= 100
+            if job["status"] == "done" or time.time() > deadline:
+                break
+            time.sleep(0.05)
+
+        assert job["status"] == "done"
+        assert job["progress"] == 100
+        trajectory = client.get(f"/api/trajectories/{job['trajectory_id']}").json()
+        assert trajectory["name"] == "Background Job"
+        assert len(trajectory["path_data"]) == job["path_points"]
+
+    def test_planner_pool_recovers_after_worker_crash(self):
+        """Test a killed worker doesn't leave the pool broken for later requests"""
+        pool = get_planner_pool()
+        future = pool.submit(time.sleep, 5)
+        while not pool._processes:
+            time.sleep(0.01)
+        for pid in list(pool._processes):
+            os.kill(pid, signal.SIGKILL)
+        with pytest.raises(BrokenProcessPool):
+            future.result(timeout=30)
+
+        trajectory_data = {
+            "name": "After Crash",
+            "wall_config": {"width": 2.0, "height": 2.0, "obstacles": []}
+        }
+        response = client.post("/api/trajectories", json=trajectory_data)
+        assert response.status_code == 200
+        assert get_planner_pool() is not pool
+
+    def test_job_failed_when_submit_fails(self, monkeypatch):
+        """Test a job whose plan can't be submitted is marked failed, not left queued"""
+        def broken_submit(*args):
+            raise RuntimeError("pool unavailable")
+        monkeypatch.setattr(main, "submit_plan", broken_submit)
+
+        trajectory_data = {
+            "name": "Submit Fails",
+            "wall_config": {"width": 2.0, "height": 2.0, "obstacles": []}
+        }
+        response = client.post("/api/trajectories?background=true", json=trajectory_data)
+        assert response.status_code == 202
+        job = client.get(f"/api/jobs/{response.json()['job_id']}").json()
+        assert job["status"] == "failed"
+        assert job["error"] == "pool unavailable"
+
+    def test_get_nonexistent_job(self):
+        """Test getting a job that doesn't exist"""
+        response = client.get("/api/jobs/missing")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Job not found"
+
+    def test_legacy_json_paths_are_migrated(self):
+        """Test paths stored inline as JSON text move to trajectory_paths on startup"""
+        remove_test_db()
+        conn = sqlite3.connect(DB_NAME)
+        conn.execute('''
+            CREATE TABLE trajectories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                wall_width REAL NOT NULL,
+                wall_height REAL NOT NULL,
+                obstacles TEXT,
+                path_data TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                execution_time REAL
+            )
+        ''')
+        cursor = conn.execute(
+            "INSERT INTO trajectories (name, wall_width, wall_height, obstacles, path_data, execution_time) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ("Legacy", 1.0, 1.0, "[]", json.dumps([[0.0, 0.0], [0.05, 0.0], [0.1, 0.0]]), 0.1)
+        )
+        conn.commit()
+        trajectory_id = cursor.lastrowid
+
+        init_db()
+        row = conn.execute("SELECT path_format, typeof(path_data) FROM trajectory_paths WHERE trajectory_id = ?",
+                           (trajectory_id,)).fetchone()
+        columns = {column[1] for column in conn.execute("PRAGMA table_info(trajectories)")}
+        conn.close()
+        assert row == (PATH_FORMAT_RLE, "blob")
+        assert "path_data" not in columns
+
+        trajectory = client.get(f"/api/trajectories/{trajectory_id}").json()
+        assert trajectory["path_data"] == [[0.0, 0.0], [0.05, 0.0], [0.1, 0.0]]
+        assert trajectory["point_count"] == 3
+        assert abs(trajectory["path_length"] - 0.1) < 1e-9
+        client.delete(f"/api/trajectories/{trajectory_id}")
+
+    def test_trajectory_metadata_without_path(self):
+        """Test metadata is precomputed and the path is only read on request"""
+        trajectory_data = {
+            "name": "Metadata",
+            "wall_config": {"width": 1.0, "height": 0.5, "obstacles": []}
+        }
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+
+        full = client.get(f"/api/trajectories/{trajectory_id}").json()
+        metadata = client.get(f"/api/trajectories/{trajectory_id}?include_path=false").json()
+        assert "path_data" not in metadata
+        assert metadata["point_count"] == len(full["path_data"])
+        assert metadata["bounds"] == pytest.approx([0.0, 0.0, 0.95, 0.45])
+        assert metadata["content_hash"] == full["content_hash"]
+
+        client.delete(f"/api/trajectories/{trajectory_id}")
+        count = db_pool.reader().execute("SELECT COUNT(*) FROM trajectory_paths").fetchone()[0]
+        assert count == 0
+
+    def test_get_trajectory_points_window(self):
+        """Test the points endpoint returns just the requested window"""
+        trajectory_data = {
+            "name": "Window",
+            "wall_config": {"width": 2.0, "height": 1.0, "obstacles": []}
+        }
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+        full = client.get(f"/api/trajectories/{trajectory_id}").json()["path_data"]
+
+        window = client.get(f"/api/trajectories/{trajectory_id}/points?start=35&count=50").json()
+        assert window["total"] == len(full)
+        assert np.allclose(window["points"], full[35:85])
+        past_end = client.get(f"/api/trajectories/{trajectory_id}/points?start={len(full)}").json()
+        assert past_end["points"] == []
+
+        # Off-lattice paths are stored as fixed-width float32 and sliced in place
+        request = TrajectoryRequest(name="Float", wall_config={"width": 1.0, "height": 1.0})
+        points = [[0.01 * i, 0.5] for i in range(1, 100)]
+        float_id = save_trajectory(request, points, 0.1).result(timeout=10)
+        window = client.get(f"/api/trajectories/{float_id}/points?start=90&count=20").json()
+        assert np.allclose(window["points"], points[90:], atol=1e-6)
+        assert client.get("/api/trajectories/999/points").status_code == 404
+
+        # Without blobopen (Python < 3.11) the window is read with substr
+        class NoBlobConnection:
+            def __init__(self, conn):
+                self.execute = conn.execute
+        fallback = read_path_window(NoBlobConnection(db_pool.reader()), float_id, PATH_FORMAT_F32, 90, 20)
+        assert np.allclose(fallback, points[90:], atol=1e-6)
+        assert len(read_path_window(NoBlobConnection(db_pool.reader()), float_id, PATH_FORMAT_F32, 200, 5)) == 0
+
+    def test_repeat_configs_hit_planner_cache(self):
+        """Test resubmitted wall configurations skip planning"""
+        trajectory_data = {
+            "name": "Cached",
+            "wall_config": {
+                "width": 2.0,
+                "height": 1.0,
+                "obstacles": [
+                    {"x": 0.5, "y": 0.5, "width": 0.2, "height": 0.2},
+                    {"x": 1.2, "y": 0.1, "width": 0.3, "height": 0.3}
+                ]
+            }
+        }
+        first = client.post("/api/trajectories", json=trajectory_data).json()
+        assert first["cache_hit"] is False
+
+        # Obstacle order doesn't change the key
+        trajectory_data["wall_config"]["obstacles"].reverse()
+        second = client.post("/api/trajectories", json=trajectory_data).json()
+        assert second["cache_hit"] is True
+        assert second["path_points"] == first["path_points"]
+
+        # The persistent table answers after the in-memory LRU is dropped
+        planner_cache.clear()
+        third = client.post("/api/trajectories", json=trajectory_data).json()
+        assert third["cache_hit"] is True
+
+        stats = client.get("/api/planner/cache").json()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 0
+        assert stats["entries"] == 1
+
+        trajectory_data["planner"] = "boustrophedon"
+        assert client.post("/api/trajectories", json=trajectory_data).json()["cache_hit"] is False
+
+    def test_identical_concurrent_plans_share_one_future(self):
+        """Test in-flight requests for the same wall are coalesced"""
+        request = TrajectoryRequest(name="Storm", wall_config={"width": 4.0, "height": 4.0})
+        key = planner_cache_key(request.wall_config)
+        first, first_coalesced = plan_once(request, key)
+        second, second_coalesced = plan_once(request, key)
+        assert second is first
+        assert (first_coalesced, second_coalesced) == (False, True)
+        first.result(timeout=30)
+
+        # Each coalesced POST still gets its own trajectory row
+        planner_cache.clear()
+        trajectory_data = {"name": "Storm", "wall_config": {"width": 4.5, "height": 4.5, "obstacles": []}}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(
+                lambda _: client.post("/api/trajectories", json=trajectory_data).json(), range(4)))
+        assert len({r["id"] for r in responses}) == 4
+        assert sum(not r["cache_hit"] and not r["coalesced"] for r in responses) == 1
+
+    def test_planner_cache_evicts_by_bytes(self):
+        """Test the in-memory LRU stays within its byte budget"""
+        cache = PlannerCache(max_bytes=1000)
+        path = [[0.05 * i, 0.0] for i in range(10)]
+        for i in range(20):
+            cache.put(f"key-{i}", path).result(timeout=10)
+        stats = cache.stats()
+        assert stats["bytes"] <= 1000
+        assert stats["evictions"] == 20 - stats["entries"]
+        assert cache.get("key-19").tolist() == path
+
+        # The persisted table keeps to the same budget, newest entries first
+        stored = db_pool.reader().execute(
+            "SELECT SUM(length(key) + length(path_data) + 128) FROM planner_cache").fetchone()
+        assert stored[0] <= 1000
+        assert db_pool.reader().execute("SELECT bytes FROM planner_cache_size").fetchone() == stored
+        assert db_pool.reader().execute(
+            "SELECT 1 FROM planner_cache WHERE key = 'key-19'").fetchone() is not None
+        assert db_pool.reader().execute(
+            "SELECT 1 FROM planner_cache WHERE key = 'key-0'").fetchone() is None
+
+    def test_planner_cache_key_includes_planner_version(self, monkeypatch):
+        """Test paths cached by an older planner version aren't served"""
+        wall_config = TrajectoryRequest(name="Versioned", wall_config={"width": 1.0, "height": 1.0}).wall_config
+        key = planner_cache_key(wall_config)
+        monkeypatch.setattr(main, "PLANNER_VERSION", main.PLANNER_VERSION + 1)
+        assert planner_cache_key(wall_config) != key
+
+    def test_connection_pool_readers(self):
+        """Test readers are per-thread WAL connections that see committed writes"""
+        reader = db_pool.reader()
+        assert db_pool.reader() is reader
+        assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(db_pool.reader()))
+        thread.start()
+        thread.join()
+        assert other[0] is not reader
+
+        trajectory_data = {"name": "Pooled", "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+        trajectory_id = client.post("/api/trajectories", json=trajectory_data).json()["id"]
+        row = reader.execute("SELECT name FROM trajectories WHERE id = ?", (trajectory_id,)).fetchone()
+        assert row == ("Pooled",)
+
+    def test_connection_pool_closes_readers_of_exited_threads(self):
+        """Test short-lived threads don't leave reader connections open"""
+        db_pool.writer()
+        before = len(db_pool._connections)
+
+        readers = []
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: readers.append(db_pool.reader()))
+            thread.start()
+            thread.join()
+
+        assert len(db_pool._connections) <= before
+        with pytest.raises(sqlite3.ProgrammingError):
+            readers[0].execute("SELECT 1")
+
+    def test_group_commit_writer(self):
+        """Test queued writes resolve individually and a failure stays isolated"""
+        def insert(name):
+            return lambda conn: conn.execute(
+                "INSERT INTO trajectories (name, wall_width, wall_height, obstacles) "
+                "VALUES (?, 1, 1, '[]')", (name,)
+            ).lastrowid
+
+        futures = [db_writer.submit(insert(f"Batch {i}")) for i in range(20)]
+        failing = db_writer.submit(lambda conn: conn.execute("INSERT INTO missing_table VALUES (1)"))
+        futures.append(db_writer.submit(insert("After failure")))
+
+        ids = [future.result(timeout=10) for future in futures]
+        assert len(set(ids)) == 21
+        with pytest.raises(sqlite3.OperationalError):
+            failing.result(timeout=10)
+        count = db_pool.reader().execute("SELECT COUNT(*) FROM trajectories").fetchone()[0]
+        assert count == 21
+
+    def test_websocket_receives_hub_events(self):
+        """Test a connected websocket receives events broadcast by the hub"""
+        with client.websocket_connect("/ws/updates") as websocket:
+            event_hub.broadcast_threadsafe("hello")
+            assert websocket.receive_text() == "hello"
+
+    def test_in_process_event_bus_delivers_api_events(self, monkeypatch):
+        """Test events reach websockets without Redis"""
+        outbox = EventOutbox(InProcessEventBus())
+        monkeypatch.setattr(main, "event_outbox", outbox)
+        assert isinstance(create_event_bus("memory"), InProcessEventBus)
+        trajectory_data = {"name": "Local Event", "wall_config": {"width": 1.0, "height": 1.0, "obstacles": []}}
+        with client.websocket_connect("/ws/updates") as websocket:
+            client.post("/api/trajectories", json=trajectory_data)
+            assert "Local Event" in websocket.receive_text()
+        outbox.close()
+        assert outbox.stats()["published"] == 1
+
+    def test_redis_publish_does_not_block(self):
+        """Test publishing returns at once even when Redis is unreachable"""
+        outbox = EventOutbox(RedisEventBus("redis://localhost:1/0"))
+        start = time.perf_counter()
+        for i in range(20):
+            outbox.put(f"event {i}")
+        assert time.perf_counter() - start < 0.1
+        outbox.close()
+        stats = outbox.stats()
+        assert stats["published"] == 0
+        assert stats["failed"] == 20
+
+    def test_event_outbox_batches_and_drops_on_overflow(self):
+        """Test a stalled bus fills the bounded outbox and extra events are counted"""
+        release = threading.Event()
+        batches = []
+
+        class StalledBus:
+            name = "stalled"
+
+            def deliver(self, messages):
+                release.wait(10)
+                batches.append(list(messages))
+
+            def close(self):
+                pass
+
+        outbox = EventOutbox(StalledBus(), size=4, batch_size=10)
+        for i in range(10):
+            outbox.put(f"event {i}")
+        release.set()
+        outbox.close()
+        stats = outbox.stats()
+        assert stats["dropped"] >= 5
+        assert stats["published"] + stats["dropped"] == 10
+        assert len(batches) <= 2
+
+    def test_event_hub_evicts_slow_consumers(self):
+        """Test a client whose queue is full is dropped without blocking others"""
+        async def scenario():
+            hub = EventHub(queue_size=2)
+            slow, fast = hub.subscribe(), hub.subscribe()
+            received = []
+            for i in range(3):
+                hub.broadcast(f"event {i}")
+                received.append(fast.get_nowait())
+            slow_messages = [slow.get_nowait() for _ in range(slow.qsize())]
+            await hub.close()
+            return received, slow_messages, hub.evictions
+
+        received, slow_messages, evictions = asyncio.run(scenario())
+        assert received == ["event 0", "event 1", "event 2"]
+        assert slow_messages == [None]
+        assert evictions == 1
+
+class TestPlanner:
+    """Test suite for the coverage planner"""
+
+    def test_generate_path_yields_segments(self):
+        """Test the planner yields row segments that concatenate to the full path"""
+        planner = CoveragePlannerSmart(1.0, 0.5, [Obstacle(x=0.3, y=0.1, width=0.2, height=0.2)])
+        segments = planner.generate_path()
+        first = next(segments)
+        assert first[0] == [0.0, 0.0]
+        rest = [point for segment in segments for point in segment]
+        assert first + rest == CoveragePlannerSmart(1.0, 0.5, [Obstacle(x=0.3, y=0.1, width=0.2, height=0.2)]).full_path()
+
+    def test_occupancy_grid_marks_obstacles(self):
+        """Test obstacles are rasterized into the uint8 grid and clipped to the wall"""
+        planner = CoveragePlannerSmart(2.0, 1.0, [
+            Obstacle(x=1.0, y=0.5, width=0.5, height=0.25),
+            Obstacle(x=1.9, y=0.9, width=1.0, height=1.0)
+        ])
+        assert planner.grid.dtype.name == "uint8"
+        assert planner.grid.shape == (20, 40)
+        assert planner.grid[10:16, 20:31].all()
+        assert planner.grid[18:, 37:].all()
+        assert planner.grid.sum() == 6 * 11 + 2 * 3
+
+    def test_boustrophedon_covers_free_cells(self):
+        """Test boustrophedon mode sweeps every free cell with unit moves"""
+        planner = CoveragePlannerSmart(2.0, 2.0, [
+            Obstacle(x=0.5, y=0.5, width=1.0, height=0.5)
+        ], mode="boustrophedon")
+        path = planner.full_path()
+        cells = [(round(y / 0.05), round(x / 0.05)) for x, y in path]
+
+        for (y0, x0), (y1, x1) in zip(cells, cells[1:]):
+            assert abs(y1 - y0) + abs(x1 - x0) <= 1
+        assert all(planner.grid[cell] == 0 for cell in cells)
+        assert set(cells) == {tuple(c) for c in zip(*(planner.grid == 0).nonzero())}
+
+    def test_free_rows_skip_search(self, monkeypatch):
+        """Test obstacle-free rows are emitted directly without running A*"""
+        planner = CoveragePlannerSmart(2.0, 2.0, [
+            Obstacle(x=0.5, y=1.0, width=0.5, height=0.2)
+        ])
+        searched = []
+        original = planner.a_star
+        monkeypatch.setattr(planner, "a_star", lambda s, g: searched.append(g[0]) or original(s, g))
+        path = planner.full_path()
+
+        assert sorted(searched) == [21, 22, 23]
+        assert len(path) > 0
+
+    def test_jps_matches_astar_cost(self):
+        """Test Jump Point Search finds equal-cost paths with fewer expansions"""
+        planner = CoveragePlannerSmart(3.0, 2.0, [
+            Obstacle(x=1.0, y=0.0, width=0.5, height=1.5),
+            Obstacle(x=2.0, y=0.5, width=0.5, height=1.5)
+        ])
+        start, goal = (0, 0), (0, planner.cols - 1)
+
+        astar_path = planner.a_star(start, goal)
+        astar_expanded, planner.expanded_nodes = planner.expanded_nodes, 0
+        jps_path = planner.jps(start, goal)
+
+        assert len(jps_path) == len(astar_path) > 0
+        assert jps_path[0] == start and jps_path[-1] == goal
+        for (y0, x0), (y1, x1) in zip(jps_path, jps_path[1:]):
+            assert abs(y1 - y0) + abs(x1 - x0) == 1
+            assert planner.grid[y1, x1] == 0
+        assert planner.expanded_nodes < astar_expanded
+
+    def test_astar_reuses_search_buffers(self):
+        """Test A* keeps one set of flat buffers across searches"""
+        planner = CoveragePlannerSmart(2.0, 2.0, [
+            Obstacle(x=0.5, y=0.0, width=0.5, height=1.5)
+        ])
+        first = planner.a_star((0, 0), (0, 39))
+        buffers = planner._buffers
+        second = planner.a_star((0, 39), (0, 0))
+
+        assert planner._buffers is buffers
+        assert len(buffers["g"]) == planner.rows * planner.cols
+        assert planner._generation == 2
+        assert len(first) == len(second) > 0
+        assert all(planner.grid[cell] == 0 for cell in first[1:])
+
+    def test_blocked_row_targets_are_snapped(self, monkeypatch):
+        """Test rows ending inside an obstacle never start a hopeless search"""
+        planner = CoveragePlannerSmart(2.0, 2.0, [
+            Obstacle(x=1.5, y=0.5, width=0.5, height=0.5)
+        ])
+        results = []
+        original = planner.a_star
+        monkeypatch.setattr(planner, "a_star", lambda s, g: results.append(original(s, g)) or results[-1])
+        path = planner.full_path()
+        cells = [(round(y / 0.05), round(x / 0.05)) for x, y in path]
+
+        assert all(results)
+        for (y0, x0), (y1, x1) in zip(cells, cells[1:]):
+            assert abs(y1 - y0) + abs(x1 - x0) <= 1
+        assert all(planner.grid[cell] == 0 for cell in cells)
+
+    def test_row_sweep_starts_next_to_origin_obstacle(self):
+        """Test an obstacle over the origin corner doesn't leave the row planner with no path"""
+        planner = CoveragePlannerSmart(4.0, 2.0, [
+            Obstacle(x=0.0, y=0.0, width=0.2, height=0.2)
+        ])
+        path = planner.full_path()
+        cells = [(round(y / 0.05), round(x / 0.05)) for x, y in path]
+
+        assert len(path) > 0
+        assert cells[0] == planner._nearest_free((0, 0))
+        assert all(planner.grid[cell] == 0 for cell in cells)
+        for (y0, x0), (y1, x1) in zip(cells, cells[1:]):
+            assert abs(y1 - y0) + abs(x1 - x0) <= 1
+        assert {y for y, _ in cells} == set(range(planner.rows))
+
+        blocked = CoveragePlannerSmart(1.0, 1.0, [Obstacle(x=0.0, y=0.0, width=1.0, height=1.0)])
+        assert blocked.full_path() == []
+
+class TestPathCodec:
+    """Test suite for binary path storage"""
+
+    def test_lattice_paths_pack_as_rle_moves(self):
+        """Test planner paths round-trip exactly through run-length moves"""
+        path = CoveragePlannerSmart(1.0, 1.0, []).full_path()
+        path_format, blob = encode_path(path)
+
+        assert path_format == PATH_FORMAT_RLE
+        assert len(blob) < len(path)
+        assert decode_path(path_format, blob).tolist() == path
+
+    def test_rle_handles_stays_and_jumps(self):
+        """Test repeated points and non-unit steps survive the RLE codec"""
+        cells = np.array([[0, 0], [1, 0], [2, 0], [2, 0], [2, 1], [40, -7], [39, -7]])
+        blob = encode_rle(cells)
+
+        assert decode_rle(blob).tolist() == cells.tolist()
+        assert rle_to_text(blob) == {"start": [0, 0], "resolution": 0.05, "moves": "R2S1D1J38,-8L1"}
+
+    def test_rle_window_matches_full_decode(self):
+        """Test windowed decoding agrees with slicing the full path"""
+        cells = np.array([[0, 0], [1, 0], [2, 0], [2, 0], [2, 1], [40, -7], [39, -7], [38, -7]])
+        blob = encode_rle(cells)
+        for start in range(len(cells) + 1):
+            for count in (1, 2, 5, 20):
+                assert decode_rle_window(blob, start, count).tolist() == cells[start:start + count].tolist()
+
+    def test_path_json_matches_json_dumps(self):
+        """Test the table-based formatter gives the same text as json.dumps"""
+        path = [[0.05 * x, 0.05 * y] for y in range(3) for x in range(-4, 30)]
+        for path_format, blob in (encode_path(path), encode_path([[0.123, 4.5]]), encode_path([])):
+            expected = json.dumps(decode_path(path_format, blob).tolist(), separators=(",", ":"))
+            assert path_to_json(path_format, blob) == expected
+
+    def test_off_lattice_paths_fall_back_to_float32(self):
+        """Test arbitrary points are stored as float32 pairs"""
+        path_format, blob = encode_path([[0.0, 0.0], [0.123, 4.5]])
+
+        assert path_format == PATH_FORMAT_F32
+        assert len(blob) == 16
+        assert abs(decode_path(path_format, blob)[1, 0] - 0.123) < 1e-6
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file